@@ -3,15 +3,14 @@ Flask API Backend for Vietnamese Food Classification
 Handles image upload and model prediction
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
 import sys
 from PIL import Image
-import base64
-import io
+import re
 import logging
 
 # Configure logging
@@ -25,13 +24,21 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import MODEL_PATH
-from model_utils import load_ml_model, predict_image, get_food_info, get_food_classes
+from model_utils import (
+    load_ml_model, predict_image, predict_array, predict_pixels, pixels_from_buffer, pixels_from_jpeg,
+    get_food_info, get_food_classes, get_model_names, get_model_registry, get_shadow_evaluator
+)
+from decode_utils import start_decode_pool, decode_pool_enabled, decoded_image, encode_jpeg
 from token_utils import (
     create_access_token, create_refresh_token, verify_token, 
     token_required, get_current_user, is_authenticated,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from history_utils import save_prediction_history, get_prediction_history, delete_history_item, delete_all_history
+from history_utils import (
+    save_prediction_history, get_prediction_history, delete_history_item, delete_all_history,
+    user_owns_image, get_history_stats, init_history_stats
+)
+from blob_utils import get_blob
 from user_utils import create_user, check_user_password
 
 app = Flask(__name__)
@@ -57,6 +64,9 @@ limiter = Limiter(
     storage_uri="memory://"
 )
 
+# Fork decode workers first, so they don't inherit an initialized TF runtime
+start_decode_pool()
+
 # Load model at startup
 load_ml_model()
 
@@ -83,9 +93,12 @@ def register():
     
     ok, msg = create_user(username, password)
     if ok:
+        init_history_stats(username)
         return jsonify({'success': True, 'message': 'User created successfully'})
+    elif msg == 'Username already exists':
+        return jsonify({'success': False, 'message': msg}), 400
     else:
-        return jsonify({'success': False, 'message': 'Username already exists'}), 400
+        return jsonify({'success': False, 'message': msg}), 500
 
 # Đăng nhập người dùng
 @app.route('/api/login', methods=['POST'])
@@ -157,6 +170,21 @@ def get_history():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# API thống kê lịch sử (đọc từ bản tổng hợp, không quét toàn bộ lịch sử)
+@app.route('/api/history/stats', methods=['GET'])
+@limiter.limit("30 per minute")
+@token_required
+def get_history_stats_route():
+    try:
+        username = request.current_user
+        return jsonify({
+            'success': True,
+            'stats': get_history_stats(username),
+            'username': username
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # API xóa toàn bộ lịch sử dự đoán
 @app.route('/api/history', methods=['DELETE'])
 @limiter.limit("5 per minute")
@@ -191,6 +219,28 @@ def delete_history_item_route(item_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# API lấy ảnh của một record lịch sử (đọc từ blob store)
+@app.route('/api/history/image/<image_id>', methods=['GET'])
+@limiter.limit("120 per minute")
+@token_required
+def get_history_image(image_id):
+    if not re.fullmatch(r'[0-9a-f]{64}', image_id):
+        return jsonify({'success': False, 'message': 'Invalid image id'}), 400
+    
+    username = request.current_user
+    if not user_owns_image(username, image_id):
+        return jsonify({'success': False, 'message': 'Image not found'}), 404
+    
+    data = get_blob(image_id)
+    if data is None:
+        return jsonify({'success': False, 'message': 'Image not found'}), 404
+    
+    # Nội dung theo hash nên không bao giờ thay đổi
+    response = Response(data, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.set_etag(image_id)
+    return response
+
 
 @app.route('/api/predict', methods=['POST'])
 @limiter.limit(
@@ -202,33 +252,78 @@ def delete_history_item_route(item_id):
     key_func=lambda: get_rate_limit_key() if is_authenticated() else None
 )
 def predict():
-    """Predict food from uploaded image"""
+    """
+    Predict food from uploaded image
+    
+    Accepted inputs:
+    - multipart/form-data with an 'image' file (any size, decoded and resized here)
+    - application/octet-stream: raw 299x299x3 uint8 RGB pixels, shape in X-Image-Shape
+    - image/jpeg: JPEG already resized to 299x299 on the client
+    For the raw body modes, lang is passed as a query parameter.
+    An optional 'model' parameter (form or query) routes to a registered model;
+    anonymous callers are limited to the default model and ROUTABLE_MODELS.
+    """
     try:
-        if 'image' not in request.files:
-            return jsonify({'success': False, 'error': 'No image provided'}), 400
+        username = get_current_user()
+        history_bytes = None
+        is_multipart = request.mimetype == 'multipart/form-data'
+        model_name = (request.form if is_multipart else request.args).get('model')
+        if model_name and model_name not in get_model_names(authenticated=username is not None):
+            if model_name in get_model_names(authenticated=True):
+                return jsonify({'success': False, 'error': 'Login required to select this model'}), 401
+            return jsonify({'success': False, 'error': f'Unknown model: {model_name}'}), 400
         
-        file = request.files['image']
-        lang = request.form.get('lang', 'VN')
+        if request.mimetype == 'application/octet-stream':
+            lang = request.args.get('lang', 'VN')
+            try:
+                pixels = pixels_from_buffer(request.get_data(), request.headers.get('X-Image-Shape'))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            
+            food_name, confidence, related = predict_pixels(pixels, top_k=4, model_name=model_name)
+            if username:
+                history_bytes = encode_jpeg(Image.fromarray(pixels))
         
-        img = Image.open(file.stream).convert('RGB')
+        elif request.mimetype == 'image/jpeg':
+            lang = request.args.get('lang', 'VN')
+            data = request.get_data()
+            try:
+                pixels = pixels_from_jpeg(data)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            
+            food_name, confidence, related = predict_pixels(pixels, top_k=4, model_name=model_name)
+            if username:
+                history_bytes = data
         
-        # Convert to base64 for history
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG", quality=85)
-        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        else:
+            if 'image' not in request.files:
+                return jsonify({'success': False, 'error': 'No image provided'}), 400
+            
+            file = request.files['image']
+            lang = request.form.get('lang', 'VN')
+            
+            if decode_pool_enabled():
+                # Decode/preprocess in worker processes, tensor handed over via shared memory
+                with decoded_image(file.read(), want_jpeg=username is not None) as (img_array, history_bytes):
+                    food_name, confidence, related = predict_array(img_array, top_k=4, model_name=model_name)
+            else:
+                img = Image.open(file.stream).convert('RGB')
+                
+                # Predict using model_utils
+                food_name, confidence, related = predict_image(img, top_k=4, model_name=model_name)
+                if username:
+                    history_bytes = encode_jpeg(img)
         
-        # Predict using model_utils
-        food_name, confidence, related = predict_image(img, top_k=4)
         food_info = get_food_info(food_name, lang)
         
         if not food_info:
             return jsonify({'success': False, 'error': 'Food information not found'}), 404
 
         # Lưu lịch sử nếu user đã đăng nhập
-        username = get_current_user()
         if username:
             try:
-                save_prediction_history(username, food_name, confidence, image_base64=img_base64)
+                save_prediction_history(username, food_name, confidence, image_bytes=history_bytes)
             except Exception as e:
                 logger.warning(f"Failed to save history: {e}")
 
@@ -245,6 +340,19 @@ def predict():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/models', methods=['GET'])
+@limiter.limit("60 per minute")
+@token_required
+def list_models():
+    """Registered models, memory use and shadow evaluation stats"""
+    shadow = get_shadow_evaluator()
+    return jsonify({
+        'success': True,
+        **get_model_registry().status(),
+        'shadow': shadow.stats() if shadow else None
+    })
+
+
 @app.route('/api/foods/search', methods=['GET'])
 @limiter.limit("60 per minute")
 def search_foods():
@@ -333,7 +441,8 @@ if __name__ == '__main__':
     logger.info("  Health: GET /api/health")
     logger.info("  Auth: POST /api/register, /api/login, /api/refresh")
     logger.info("  Food: POST /api/predict, GET /api/food/<name>, /api/foods/search")
-    logger.info("  History: GET /api/history, DELETE /api/history[/<id>]")
+    logger.info("  Models: GET /api/models")
+    logger.info("  History: GET /api/history[/stats], DELETE /api/history[/<id>], GET /api/history/image/<id>")
     logger.info("="*50)
     
     app.run(debug=debug, host='0.0.0.0', port=port)
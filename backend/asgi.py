@@ -0,0 +1,192 @@
+"""
+ASGI serving mode for the Flask API
+
+Connections, request bodies and responses are handled on an asyncio event
+loop, so slow uploads and downloads only cost a coroutine, not a thread.
+Once a request body has fully arrived, the unchanged Flask app runs in a
+bounded thread pool: /api/predict (decode + inference) gets its own small
+pool, all other routes share a general one. Route behaviour and JSON
+shapes are identical to running api.py directly: by default requests wait
+for a free worker however long the queue gets, as with Flask's threaded
+server. Setting ASGI_QUEUE_PER_WORKER opts into load shedding (503 once
+the queue is full, checked before the body is read).
+
+Usage:
+    cd backend && uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import os
+import io
+import sys
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from api import app as flask_app
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.getenv('ASGI_INFERENCE_WORKERS', 2))
+GENERAL_WORKERS = int(os.getenv('ASGI_GENERAL_WORKERS', 16))
+# Requests allowed to wait for a pool slot, per worker, before answering 503
+# (0 = unbounded queue, never shed)
+QUEUE_PER_WORKER = int(os.getenv('ASGI_QUEUE_PER_WORKER', 0))
+MAX_BODY_SIZE = int(os.getenv('MAX_FILE_SIZE', 10 * 1024 * 1024))
+
+INFERENCE_PATHS = ('/api/predict',)
+
+
+class _Pool:
+    """Thread pool with an optional bound on queued + running requests"""
+
+    def __init__(self, name, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.capacity = workers * (1 + QUEUE_PER_WORKER) if QUEUE_PER_WORKER > 0 else None
+        self.pending = 0
+
+    def reserve(self):
+        """Claim a place for a request; False if the pool is full (only when shedding)"""
+        if self.capacity is not None and self.pending >= self.capacity:
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        self.pending -= 1
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+
+_inference_pool = _Pool('inference', INFERENCE_WORKERS)
+_general_pool = _Pool('general', GENERAL_WORKERS)
+
+
+def _build_environ(scope, body):
+    """Translate an ASGI HTTP scope + buffered body into a WSGI environ"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client_host, client_port = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client_host,
+        'REMOTE_PORT': str(client_port),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """Run the Flask app to completion in a worker thread"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    result = flask_app.wsgi_app(environ, start_response)
+    try:
+        response['body'] = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive):
+    """Buffer the request body on the event loop; None if it exceeds MAX_BODY_SIZE"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _handle_http(scope, receive, send):
+    # Shed before buffering the body, so rejected uploads cost nothing
+    pool = _inference_pool if scope['path'] in INFERENCE_PATHS else _general_pool
+    if not pool.reserve():
+        await _send_json(send, 503, {'success': False, 'error': 'Server busy, please retry'})
+        return
+
+    try:
+        try:
+            body = await _read_body(receive)
+        except ConnectionError:
+            return
+        if body is None:
+            await _send_json(send, 413, {'success': False, 'error': 'Request body too large'})
+            return
+
+        response = await pool.run(_call_flask, _build_environ(scope, body))
+    finally:
+        pool.release()
+
+    await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+    await send({'type': 'http.response.body', 'body': response['body']})
+
+
+async def _handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            logger.info(f"ASGI mode: {INFERENCE_WORKERS} inference / {GENERAL_WORKERS} general workers, "
+                        f"queue per worker: {QUEUE_PER_WORKER or 'unbounded'}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _inference_pool.executor.shutdown(wait=False)
+            _general_pool.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'http':
+        await _handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _handle_lifespan(receive, send)
@@ -0,0 +1,260 @@
+"""
+CPU inference auto-tuner
+
+Benchmarks the InceptionV3 model under different TensorFlow settings and
+writes the fastest configuration to TUNING_PROFILE_PATH, which
+model_utils.load_ml_model applies on later starts.
+
+Thread counts can only be set before the TF runtime starts, so every
+candidate runs in a fresh subprocess. The search is staged: thread counts
+first, then XLA JIT, then bfloat16 (only on CPUs with native bf16 support,
+and only if predictions on real photos agree with float32).
+
+Trials time the same SavedModel signature the server runs (unless
+MODEL_CACHE=0). The tuned batch_size only applies to batched inference
+(tests/evaluate.py); the API predicts one image per request.
+
+Usage:
+    python backend/autotune.py [--images DIR] [--min-agreement 0.99]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import IMAGE_SIZE, TUNING_PROFILE_PATH
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_CANDIDATES = [1, 2, 4, 8, 16]
+CHECK_SAMPLES = 32
+# Decoded test images cached by tests/evaluate.py
+EVAL_CACHE_DIR = os.path.join('Models', 'InceptionV3', 'eval_cache')
+WARMUP_RUNS = 3
+TIMED_RUNS = 20
+
+
+def load_check_inputs(images_dir=None):
+    """
+    Inputs for the accuracy check: photos from images_dir, else the cached
+    evaluation shards (tests/evaluate.py), else fixed noise
+
+    Returns:
+        tuple: (preprocessed float32 batch, True if these are real photos)
+    """
+    from tensorflow.keras.applications.inception_v3 import preprocess_input
+
+    if images_dir:
+        from PIL import Image
+
+        extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+        files = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(extensions))
+        if files:
+            batch = np.stack([
+                np.asarray(Image.open(os.path.join(images_dir, f)).convert('RGB').resize(IMAGE_SIZE),
+                           dtype=np.float32)
+                for f in files[:CHECK_SAMPLES]
+            ])
+            return preprocess_input(batch), True
+        logger.warning(f"No images found in {images_dir}")
+
+    shards = sorted(glob.glob(os.path.join(BASE_DIR, EVAL_CACHE_DIR, '*', 'shard_000_images.npy')),
+                    key=os.path.getmtime)
+    if shards:
+        # Spread the samples over the shard: it is sorted by class
+        images = np.load(shards[-1], mmap_mode='r')
+        picks = np.linspace(0, len(images) - 1, min(CHECK_SAMPLES, len(images))).astype(int)
+        logger.info(f"Using {len(picks)} cached evaluation images from {os.path.dirname(shards[-1])}")
+        return preprocess_input(images[picks].astype(np.float32)), True
+
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, (CHECK_SAMPLES, IMAGE_SIZE[0], IMAGE_SIZE[1], 3)).astype(np.float32), False
+
+
+def run_trial(settings, inputs_path, outputs_path):
+    """Benchmark one configuration (runs inside a fresh subprocess)"""
+    from model_utils import MODEL_PATH, apply_tuning_profile, to_mixed_bfloat16
+    from model_cache_utils import CACHE_ENABLED, CachedModel, export_saved_model
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    apply_tuning_profile(settings)
+    model = load_model(os.path.join(BASE_DIR, MODEL_PATH), compile=False)
+    if settings.get('precision') == 'mixed_bfloat16':
+        model = to_mixed_bfloat16(model)
+
+    export_dir = None
+    if CACHE_ENABLED:
+        # Time the SavedModel signature the server actually runs, not Keras predict
+        export_dir = tempfile.mkdtemp(prefix='autotune-')
+        export_saved_model(model, os.path.join(export_dir, 'model'))
+        model = CachedModel(tf.saved_model.load(os.path.join(export_dir, 'model')))
+
+    try:
+        return _time_model(model, inputs_path, outputs_path)
+    finally:
+        if export_dir:
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+
+def _time_model(model, inputs_path, outputs_path):
+    """Measure single-image latency and batch throughput, save predictions"""
+    single = np.load(inputs_path)[:1]
+    for _ in range(WARMUP_RUNS):
+        model.predict(single, verbose=0)
+
+    latencies = []
+    for _ in range(TIMED_RUNS):
+        start = time.perf_counter()
+        model.predict(single, verbose=0)
+        latencies.append(time.perf_counter() - start)
+
+    throughput = {}
+    for batch_size in BATCH_CANDIDATES:
+        batch = np.repeat(single, batch_size, axis=0)
+        model.predict(batch, batch_size=batch_size, verbose=0)
+        start = time.perf_counter()
+        for _ in range(3):
+            model.predict(batch, batch_size=batch_size, verbose=0)
+        throughput[str(batch_size)] = 3 * batch_size / (time.perf_counter() - start)
+
+    np.save(outputs_path, model.predict(np.load(inputs_path), verbose=0).astype(np.float32))
+
+    return {
+        'latency_ms': float(np.median(latencies) * 1000),
+        'throughput': throughput
+    }
+
+
+def benchmark(settings, inputs_path):
+    """Run a trial in a subprocess and return its results with the predictions"""
+    fd, outputs_path = tempfile.mkstemp(suffix='.npy')
+    os.close(fd)
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--trial', json.dumps(settings),
+             '--inputs', inputs_path, '--outputs', outputs_path],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            logger.warning(f"Trial {settings} failed: {proc.stderr.strip().splitlines()[-1:]}")
+            return None
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['predictions'] = np.load(outputs_path)
+    finally:
+        os.remove(outputs_path)
+
+    logger.info(f"{settings} -> {result['latency_ms']:.1f}ms/img, "
+                f"best batch {max(result['throughput'].values()):.1f} img/s")
+    return result
+
+
+def thread_candidates(cpu_count):
+    intra = sorted({1, max(1, cpu_count // 2), cpu_count})
+    inter = sorted({1, min(2, cpu_count)})
+    return [(a, b) for a in intra for b in inter]
+
+
+def autotune(images_dir=None, min_agreement=0.99):
+    """
+    Search for the fastest CPU inference settings and write the profile
+
+    Returns:
+        dict: The written profile
+    """
+    from model_utils import get_cpu_signature
+
+    cpu = get_cpu_signature()
+    logger.info(f"Auto-tuning on {cpu['model']} ({cpu['cpu_count']} CPUs, bf16={cpu['bf16']})")
+
+    fd, inputs_path = tempfile.mkstemp(suffix='.npy')
+    os.close(fd)
+    try:
+        inputs, real_inputs = load_check_inputs(images_dir)
+        np.save(inputs_path, inputs)
+
+        # Stage 1: thread counts (float32, no XLA)
+        best_settings, best = None, None
+        for intra, inter in thread_candidates(cpu['cpu_count']):
+            settings = {'intra_op_threads': intra, 'inter_op_threads': inter,
+                        'xla': False, 'precision': 'float32'}
+            result = benchmark(settings, inputs_path)
+            if result and (best is None or result['latency_ms'] < best['latency_ms']):
+                best_settings, best = settings, result
+        if best is None:
+            raise RuntimeError("All auto-tune trials failed")
+        reference = best['predictions']
+
+        # Stage 2: XLA JIT
+        settings = {**best_settings, 'xla': True}
+        result = benchmark(settings, inputs_path)
+        if result and result['latency_ms'] < best['latency_ms']:
+            best_settings, best = settings, result
+
+        # Stage 3: bfloat16, only where the CPU supports it natively and
+        # agreement can be measured on real photos (noise says nothing)
+        agreement = None
+        if cpu['bf16'] and not real_inputs:
+            logger.info("Skipping bfloat16: no real images for the accuracy check "
+                        "(pass --images or run tests/evaluate.py first)")
+        elif cpu['bf16']:
+            settings = {**best_settings, 'precision': 'mixed_bfloat16'}
+            result = benchmark(settings, inputs_path)
+            if result:
+                agreement = float(np.mean(
+                    result['predictions'].argmax(axis=1) == reference.argmax(axis=1)
+                ))
+                logger.info(f"bfloat16 top-1 agreement with float32: {agreement:.3f}")
+                if agreement >= min_agreement and result['latency_ms'] < best['latency_ms']:
+                    best_settings, best = settings, result
+    finally:
+        os.remove(inputs_path)
+
+    batch_size = int(max(best['throughput'], key=best['throughput'].get))
+    profile = {
+        **best_settings,
+        'batch_size': batch_size,
+        'latency_ms': round(best['latency_ms'], 2),
+        'throughput': {k: round(v, 2) for k, v in best['throughput'].items()},
+        'bf16_agreement': agreement,
+        'cpu': cpu,
+        'tuned_at': datetime.now().isoformat()
+    }
+
+    profile_path = os.path.join(BASE_DIR, TUNING_PROFILE_PATH)
+    with open(profile_path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2, ensure_ascii=False)
+    logger.info(f"Saved tuning profile to {profile_path}: {best_settings}, batch={batch_size}")
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Auto-tune CPU inference settings')
+    parser.add_argument('--images', help='Folder of sample photos for the bfloat16 accuracy check')
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help='Minimum bfloat16 top-1 agreement with float32 (default: 0.99)')
+    parser.add_argument('--trial', help=argparse.SUPPRESS)
+    parser.add_argument('--inputs', help=argparse.SUPPRESS)
+    parser.add_argument('--outputs', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        print(json.dumps(run_trial(json.loads(args.trial), args.inputs, args.outputs)))
+    else:
+        autotune(args.images, args.min_agreement)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""
+Content-addressed blob store for prediction images
+
+Images are stored once per SHA-256 digest as raw bytes in append-only
+segment files. The index maps each digest to its segment, offset, length
+and reference count. It is persisted as a snapshot (index.json) plus an
+append-only journal (index.log): every change appends one small record, and
+the snapshot is only rewritten at checkpoints, so a put or release costs
+O(1) on disk regardless of how many blobs exist.
+
+Reads go through memory-mapped segments. Segments that are mostly garbage
+are rewritten by a background compaction thread, which copies live blobs
+without holding the index lock and only swaps the index entries under it.
+"""
+import os
+import json
+import mmap
+import hashlib
+import threading
+import logging
+from file_utils import load_json_file, save_json_file
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = os.path.join(os.path.dirname(__file__), 'data', 'blobs')
+INDEX_PATH = os.path.join(BLOB_DIR, 'index.json')
+LOG_PATH = os.path.join(BLOB_DIR, 'index.log')
+
+SEGMENT_MAX_BYTES = int(os.getenv('BLOB_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+COMPACT_DEAD_RATIO = float(os.getenv('BLOB_COMPACT_DEAD_RATIO', 0.5))
+# Journal records replayed on top of the snapshot before it is rewritten
+CHECKPOINT_RECORDS = int(os.getenv('BLOB_INDEX_CHECKPOINT_RECORDS', 10000))
+
+_lock = threading.RLock()
+_compaction_lock = threading.Lock()
+_index = None
+_log_records = 0
+_mmaps = {}
+_compaction_thread = None
+
+
+def _segment_path(segment):
+    return os.path.join(BLOB_DIR, segment)
+
+
+def _apply(record):
+    """Apply one journal record to the in-memory index"""
+    index = _index
+    op = record['op']
+
+    if op == 'segment':
+        index['segments'][record['segment']] = {'size': 0, 'dead': 0}
+        index['next_segment'] += 1
+        if record.get('active'):
+            index['active'] = record['segment']
+    elif op == 'seal':
+        index['active'] = None
+    elif op in ('put', 'move'):
+        # Bytes between the recorded end and offset belong to a write that
+        # crashed before it was journaled: count them as garbage
+        stats = index['segments'][record['segment']]
+        stats['dead'] += record['offset'] - stats['size']
+        stats['size'] = record['offset'] + record['length']
+        if op == 'put':
+            index['blobs'][record['id']] = {
+                'segment': record['segment'],
+                'offset': record['offset'],
+                'length': record['length'],
+                'refs': 1
+            }
+        else:
+            entry = index['blobs'].get(record['id'])
+            if entry is None:
+                stats['dead'] += record['length']
+            else:
+                entry['segment'], entry['offset'] = record['segment'], record['offset']
+    elif op == 'ref':
+        entry = index['blobs'][record['id']]
+        entry['refs'] += record['delta']
+        if entry['refs'] <= 0:
+            del index['blobs'][record['id']]
+            index['segments'][entry['segment']]['dead'] += entry['length']
+    elif op == 'drop':
+        del index['segments'][record['segment']]
+
+    index['seq'] = record['seq']
+
+
+def _load_index():
+    """Load the snapshot and replay the journal (cached after first call)"""
+    global _index, _log_records
+    if _index is not None:
+        return _index
+
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    _index = load_json_file(INDEX_PATH, default={})
+    _index.setdefault('seq', 0)
+    _index.setdefault('active', None)
+    _index.setdefault('next_segment', 1)
+    _index.setdefault('segments', {})
+    _index.setdefault('blobs', {})
+
+    torn = False
+    if os.path.exists(LOG_PATH):
+        with open(LOG_PATH, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Record of a write that crashed midway; never acknowledged
+                    torn = True
+                    continue
+                # Records already folded into the snapshot are skipped
+                if record['seq'] > _index['seq']:
+                    _apply(record)
+                    _log_records += 1
+
+    if torn or _log_records >= CHECKPOINT_RECORDS:
+        _checkpoint()
+    return _index
+
+
+def _journal(**record):
+    """Durably append a record to the journal, then apply it (caller holds lock)"""
+    global _log_records
+    record['seq'] = _index['seq'] + 1
+    with open(LOG_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    _apply(record)
+    _log_records += 1
+
+
+def _checkpoint():
+    """Rewrite the snapshot and empty the journal (caller holds lock)"""
+    global _log_records
+    if not save_json_file(INDEX_PATH, _index):
+        raise IOError(f"Failed to write blob index {INDEX_PATH}")
+    # A crash before truncating is harmless: replay skips records <= seq
+    with open(LOG_PATH, 'w', encoding='utf-8') as f:
+        os.fsync(f.fileno())
+    _log_records = 0
+
+
+def _maybe_checkpoint():
+    if _log_records >= CHECKPOINT_RECORDS:
+        _checkpoint()
+
+
+def _new_segment(active):
+    """Journal a new segment, returning its name"""
+    segment = f"segment-{_index['next_segment']:06d}.dat"
+    _journal(op='segment', segment=segment, active=active)
+    return segment
+
+
+def _write_segment(segment, data, sync=True):
+    """Append bytes to a segment file, returning their offset"""
+    with open(_segment_path(segment), 'ab') as f:
+        # Start from the real end of file: bytes of a write that crashed
+        # before it was journaled are left behind as garbage
+        offset = f.seek(0, os.SEEK_END)
+        f.write(data)
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+    return offset
+
+
+def _close_mmap(segment):
+    mapped = _mmaps.pop(segment, None)
+    if mapped is not None:
+        mapped.close()
+
+
+def _get_mmap(segment, end):
+    """Get a read-only map of a segment covering at least `end` bytes"""
+    mapped = _mmaps.get(segment)
+    if mapped is None or len(mapped) < end:
+        _close_mmap(segment)
+        with open(_segment_path(segment), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _mmaps[segment] = mapped
+    return mapped
+
+
+def put_blob(data):
+    """
+    Store bytes (or add a reference if already stored)
+
+    Args:
+        data: Raw bytes
+
+    Returns:
+        str: Hex SHA-256 digest identifying the blob
+    """
+    blob_id = hashlib.sha256(data).hexdigest()
+    with _lock:
+        index = _load_index()
+        if blob_id in index['blobs']:
+            _journal(op='ref', id=blob_id, delta=1)
+        else:
+            segment = index['active']
+            if segment is None or index['segments'][segment]['size'] + len(data) > SEGMENT_MAX_BYTES:
+                segment = _new_segment(active=True)
+            offset = _write_segment(segment, data)
+            _journal(op='put', id=blob_id, segment=segment, offset=offset, length=len(data))
+        _maybe_checkpoint()
+    return blob_id
+
+
+def get_blob(blob_id):
+    """
+    Read a blob through its memory-mapped segment
+
+    Returns:
+        bytes: Blob content, or None if unknown
+    """
+    with _lock:
+        entry = _load_index()['blobs'].get(blob_id)
+        if entry is None:
+            return None
+        if entry['length'] == 0:
+            return b''
+        start = entry['offset']
+        end = start + entry['length']
+        return _get_mmap(entry['segment'], end)[start:end]
+
+
+def release_blob(blob_id):
+    """
+    Drop one reference to a blob; unreferenced blobs become garbage
+
+    Returns:
+        bool: True if the blob existed
+    """
+    with _lock:
+        index = _load_index()
+        if blob_id not in index['blobs']:
+            return False
+
+        _journal(op='ref', id=blob_id, delta=-1)
+        _maybe_checkpoint()
+
+        if _compactable_segments():
+            _schedule_compaction()
+    return True
+
+
+def release_blobs(blob_ids):
+    """Drop one reference for each id in blob_ids"""
+    for blob_id in blob_ids:
+        release_blob(blob_id)
+
+
+def _compactable_segments():
+    """Segments whose garbage ratio reached COMPACT_DEAD_RATIO"""
+    compactable = []
+    for segment, stats in _index['segments'].items():
+        if stats['size'] == 0:
+            if segment != _index['active']:
+                compactable.append(segment)
+        elif stats['dead'] / stats['size'] >= COMPACT_DEAD_RATIO:
+            compactable.append(segment)
+    return compactable
+
+
+def _copy_live_blobs(live):
+    """
+    Copy blobs into fresh segments without holding the index lock
+
+    Args:
+        live: List of (blob_id, segment, offset, length) to copy
+
+    Returns:
+        list: (blob_id, old segment, old offset, new segment, new offset, length)
+    """
+    moves = []
+    target, target_size = None, 0
+    sources = {}
+    try:
+        for blob_id, segment, offset, length in live:
+            if target is None or target_size + length > SEGMENT_MAX_BYTES:
+                if target is not None:
+                    _write_segment(target, b'')  # fsync the finished segment
+                with _lock:
+                    target = _new_segment(active=False)
+                target_size = 0
+
+            # Read through a private handle: shared mmaps may be remapped by readers
+            source = sources.get(segment)
+            if source is None:
+                source = sources[segment] = open(_segment_path(segment), 'rb')
+            source.seek(offset)
+            new_offset = _write_segment(target, source.read(length), sync=False)
+            target_size = new_offset + length
+            moves.append((blob_id, segment, offset, target, new_offset, length))
+
+        if target is not None:
+            _write_segment(target, b'')
+    finally:
+        for source in sources.values():
+            source.close()
+    return moves
+
+
+def compact_blobs():
+    """
+    Copy live blobs out of mostly-dead segments and delete those segments
+
+    Returns:
+        int: Number of bytes reclaimed
+    """
+    with _compaction_lock:
+        with _lock:
+            index = _load_index()
+            segments = _compactable_segments()
+            if not segments:
+                return 0
+            if index['active'] in segments:
+                # Seal the active segment so new puts go to a fresh one
+                _journal(op='seal')
+            live = sorted(
+                (blob_id, entry['segment'], entry['offset'], entry['length'])
+                for blob_id, entry in index['blobs'].items() if entry['segment'] in segments
+            )
+
+        moves = _copy_live_blobs(live)
+
+        with _lock:
+            for blob_id, segment, offset, target, new_offset, length in moves:
+                entry = index['blobs'].get(blob_id)
+                # Blobs released (and possibly re-added elsewhere) meanwhile stay where they are
+                moved_id = blob_id if entry and (entry['segment'], entry['offset']) == (segment, offset) else None
+                _journal(op='move', id=moved_id, segment=target, offset=new_offset, length=length)
+
+            reclaimed = 0
+            for segment in segments:
+                reclaimed += index['segments'][segment]['dead']
+                _journal(op='drop', segment=segment)
+            _checkpoint()
+
+            for segment in segments:
+                _close_mmap(segment)
+                try:
+                    os.remove(_segment_path(segment))
+                except OSError as e:
+                    logger.warning(f"Failed to remove blob segment {segment}: {e}")
+
+    if reclaimed:
+        logger.info(f"Blob compaction reclaimed {reclaimed} bytes")
+    return reclaimed
+
+
+def _run_compaction():
+    try:
+        compact_blobs()
+    except Exception as e:
+        logger.error(f"Blob compaction failed: {e}")
+
+
+def _schedule_compaction():
+    """Start background compaction unless one is already running"""
+    global _compaction_thread
+    if _compaction_thread is not None and _compaction_thread.is_alive():
+        return
+    _compaction_thread = threading.Thread(target=_run_compaction, name='blob-compaction', daemon=True)
+    _compaction_thread.start()
@@ -0,0 +1,254 @@
+"""
+Parallel image decode/preprocess worker pool
+
+Uploads are decoded, resized and scaled in worker processes instead of the
+request thread, so PIL work scales across cores and doesn't compete with
+Flask and TensorFlow for the GIL. Each worker writes the finished
+1x299x299x3 float32 tensor into a slot of a preallocated shared-memory ring;
+the request thread then hands a view of that slot to the model without
+copying or pickling the tensor.
+
+Workers are forked before the model is loaded (see api.py), so they share
+the already-imported modules copy-on-write and never initialize
+TensorFlow. Where fork isn't available (Windows), decoding stays in the
+request thread.
+
+A request that waits longer than DECODE_TIMEOUT for a slot or a result, or
+whose worker dies (e.g. OOM-killed on a huge upload), is decoded in its own
+thread instead. A stuck worker is killed so its slot goes back to the ring.
+A killed or dead worker breaks the pool, and decoding then stays in request
+threads: a new pool would have to fork from the running server, whose
+threads (TensorFlow, logging) may hold locks the children inherit.
+"""
+import os
+import io
+import time
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from PIL import Image
+
+from model_utils import IMAGE_SIZE, preprocess_pixels
+
+logger = logging.getLogger(__name__)
+
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', 2))
+# Ring slots bound how many decoded images can be in flight at once
+DECODE_SLOTS = int(os.getenv('DECODE_SLOTS', 2 * DECODE_WORKERS))
+# Seconds to wait for a free slot or a worker result before decoding in-thread
+DECODE_TIMEOUT = float(os.getenv('DECODE_TIMEOUT', 30))
+
+SLOT_SHAPE = (1, IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+SLOT_BYTES = int(np.prod(SLOT_SHAPE)) * np.dtype(np.float32).itemsize
+
+_executor = None
+_shm = None
+_free_slots = None
+_executor_lock = threading.Lock()
+
+
+def encode_jpeg(img):
+    """Encode a PIL Image as JPEG bytes for history (stored in blob store)"""
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=85)
+    return buffered.getvalue()
+
+
+def _slot_array(slot):
+    """View one ring slot as a float32 model input batch"""
+    return np.ndarray(SLOT_SHAPE, dtype=np.float32, buffer=_shm.buf, offset=slot * SLOT_BYTES)
+
+
+def _decode(data, out, want_jpeg):
+    """Decode + preprocess into out, optionally return history JPEG"""
+    img = Image.open(io.BytesIO(data)).convert('RGB')
+    pixels = np.asarray(img.resize(IMAGE_SIZE), dtype=np.uint8)
+    preprocess_pixels(pixels, out=out)
+    return encode_jpeg(img) if want_jpeg else None
+
+
+def _decode_into_slot(data, slot, want_jpeg):
+    """Worker: decode into a ring slot"""
+    return _decode(data, _slot_array(slot), want_jpeg)
+
+
+def _decode_in_thread(data, want_jpeg):
+    """Fallback: decode in the request thread into a private array"""
+    img_array = np.empty(SLOT_SHAPE, dtype=np.float32)
+    return img_array, _decode(data, img_array, want_jpeg)
+
+
+def _new_executor(workers):
+    """Create a fork-based executor with all of its workers already started"""
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    # Workers may be started lazily; occupy all of them now so they fork here
+    list(executor.map(time.sleep, [0.05] * workers))
+    return executor
+
+
+def _kill_workers(executor):
+    """Terminate a pool's workers, e.g. one stuck on a pathological image
+
+    The pool breaks, which fails its pending futures and so frees their slots.
+    """
+    # ProcessPoolExecutor has no public way to stop running jobs before 3.14
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+
+
+def _disable_broken_executor(broken):
+    """Stop using a pool whose worker died (only once per breakage)
+
+    The pool isn't replaced: forking from the running server could copy a
+    lock held by another thread into the child and deadlock it.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        logger.error("Decode pool broken (worker died or was killed), decoding in request threads from now on")
+
+
+class _SlotLease:
+    """A ring slot shared by the request and its worker, freed when both are done
+
+    If the request stops waiting (timeout), the worker may still be writing
+    into the slot, so it only goes back to the ring once the worker finishes.
+    """
+
+    def __init__(self, slot, free_slots):
+        self.slot = slot
+        self.free_slots = free_slots
+        self.holders = 2
+        self.lock = threading.Lock()
+
+    def release(self, *_):
+        with self.lock:
+            self.holders -= 1
+            last = self.holders == 0
+        if last:
+            self.free_slots.put(self.slot)
+
+
+def start_decode_pool(workers=DECODE_WORKERS, slots=DECODE_SLOTS):
+    """
+    Allocate the shared-memory ring and fork decode workers
+
+    Must be called before the model is loaded so workers don't inherit an
+    initialized TensorFlow runtime.
+
+    Returns:
+        bool: True if the pool is running
+    """
+    global _executor, _shm, _free_slots
+
+    if _executor is not None:
+        return True
+    if workers <= 0:
+        return False
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        logger.info("Decode pool needs fork, decoding in request threads instead")
+        return False
+
+    slots = max(slots, workers)
+    _shm = shared_memory.SharedMemory(create=True, size=slots * SLOT_BYTES)
+    _free_slots = queue.Queue()
+    for slot in range(slots):
+        _free_slots.put(slot)
+
+    _executor = _new_executor(workers)
+    atexit.register(stop_decode_pool)
+    logger.info(f"Decode pool started: {workers} workers, {slots} shared-memory slots "
+                f"({slots * SLOT_BYTES / 2**20:.0f}MB)")
+    return True
+
+
+def stop_decode_pool():
+    global _executor, _shm, _free_slots
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _shm is not None:
+        _shm.close()
+        _shm.unlink()
+        _shm = None
+    _free_slots = None
+
+
+def decode_pool_enabled():
+    return _executor is not None
+
+
+@contextmanager
+def decoded_image(data, want_jpeg=False):
+    """
+    Decode and preprocess an uploaded image in the worker pool
+
+    Blocks while all ring slots are in use (backpressure). The yielded array
+    is a view into shared memory and is only valid inside the with-block.
+    Falls back to decoding in the calling thread after DECODE_TIMEOUT or if
+    the worker dies; errors from decoding itself (bad image) are raised.
+
+    Args:
+        data: Uploaded image bytes (any format/size PIL can open)
+        want_jpeg: Also return a re-encoded JPEG for history
+
+    Yields:
+        tuple: (1xHxWx3 float32 input batch, JPEG bytes or None)
+    """
+    free_slots = _free_slots
+    try:
+        slot = free_slots.get(timeout=DECODE_TIMEOUT)
+    except queue.Empty:
+        logger.warning(f"No free decode slot after {DECODE_TIMEOUT}s, decoding in request thread")
+        yield _decode_in_thread(data, want_jpeg)
+        return
+
+    lease = _SlotLease(slot, free_slots)
+    executor = _executor
+    jpeg = None
+    in_thread = False
+    try:
+        future = None
+        if executor is not None:
+            try:
+                future = executor.submit(_decode_into_slot, data, slot, want_jpeg)
+            except (BrokenProcessPool, RuntimeError):
+                # Broken, or already shut down by another request
+                _disable_broken_executor(executor)
+
+        if future is None:
+            lease.release()  # never reached a worker
+            in_thread = True
+        else:
+            future.add_done_callback(lease.release)
+            try:
+                jpeg = future.result(timeout=DECODE_TIMEOUT)
+            except FutureTimeoutError:
+                logger.warning(f"Decode worker took over {DECODE_TIMEOUT}s, decoding in request thread")
+                if not future.cancel():
+                    # Already running: kill it, or its slot never comes back
+                    _kill_workers(executor)
+                    _disable_broken_executor(executor)
+                in_thread = True
+            except BrokenProcessPool:
+                _disable_broken_executor(executor)
+                in_thread = True
+
+        if in_thread:
+            yield _decode_in_thread(data, want_jpeg)
+        else:
+            yield _slot_array(slot), jpeg
+    finally:
+        lease.release()
@@ -1,13 +1,50 @@
 """
 File utilities for JSON I/O operations
 Provides consistent error handling for file operations
+
+Writes are crash-safe (temp file + fsync + rename) and serialized per file.
+Concurrent updates to the same file are group-committed: the first caller
+waits a short write-behind window, then applies every queued update in order
+and rewrites the file once for the whole batch.
 """
+import copy
 import json
 import os
+import tempfile
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Write-behind window used to coalesce bursts of updates (milliseconds)
+WRITE_BEHIND_MS = float(os.getenv('JSON_WRITE_BEHIND_MS', 5))
+
+# Per-file locks and pending update batches, keyed by absolute path
+_file_locks = {}
+_pending_batches = {}
+_registry_lock = threading.Lock()
+
+
+class _UpdateBatch:
+    """Updates queued for one file, committed together by a single writer"""
+
+    def __init__(self):
+        self.updates = []
+        self.errors = {}
+        self.result = False
+        self.done = threading.Event()
+
+
+def get_file_lock(file_path):
+    """Get the lock serializing writes to a file"""
+    path = os.path.abspath(file_path)
+    with _registry_lock:
+        lock = _file_locks.get(path)
+        if lock is None:
+            lock = _file_locks[path] = threading.RLock()
+        return lock
+
 
 def load_json_file(file_path, default=None):
     """
@@ -34,36 +71,99 @@ def load_json_file(file_path, default=None):
         return default
 
 
-def save_json_file(file_path, data, indent=2):
+def _fsync_dir(dir_path):
+    """Persist a rename by syncing its directory (no-op where unsupported)"""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(file_path, data, indent):
+    """Write JSON to a temp file in the same directory, fsync, then rename"""
+    dir_path = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(dir_path, exist_ok=True)
+
+    separators = (',', ':') if indent is None else None
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f'.{os.path.basename(file_path)}.', suffix='.tmp', dir=dir_path
+    )
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent, separators=separators)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(dir_path)
+
+
+def save_json_file(file_path, data, indent=None):
     """
     Save data to JSON file with error handling
     
     Args:
         file_path: Path to JSON file
         data: Data to save
-        indent: Indentation level (default: 2)
+        indent: Indentation level (default: None, compact output)
         
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        # Ensure directory exists
-        dir_path = os.path.dirname(file_path)
-        if dir_path and not os.path.exists(dir_path):
-            os.makedirs(dir_path)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=indent)
+        with get_file_lock(file_path):
+            _write_atomic(file_path, data, indent)
         return True
-    except IOError as e:
+    except (IOError, OSError, TypeError, ValueError) as e:
         logger.error(f"Failed to write {file_path}: {e}")
         return False
 
 
+def _commit_batch(file_path, batch, default):
+    """Apply all queued updates of a batch and write the file once"""
+    with get_file_lock(file_path):
+        # Close the batch: updates arriving from now on start a new one
+        with _registry_lock:
+            if _pending_batches.get(os.path.abspath(file_path)) is batch:
+                del _pending_batches[os.path.abspath(file_path)]
+
+        data = load_json_file(file_path, default)
+        for index, update_fn in enumerate(batch.updates):
+            # Update a copy so a failing update_fn can't leave a partial
+            # change behind for the rest of the batch to persist
+            try:
+                data = update_fn(copy.deepcopy(data))
+            except Exception as e:
+                batch.errors[index] = e
+
+        if len(batch.errors) == len(batch.updates):
+            batch.result = False
+        else:
+            batch.result = save_json_file(file_path, data)
+
+        if len(batch.updates) > 1:
+            logger.debug(f"Group-committed {len(batch.updates)} updates to {file_path}")
+
+
 def update_json_file(file_path, update_fn, default=None):
     """
     Load, update, and save JSON file atomically
     
+    Updates to the same file issued within the write-behind window are
+    applied in arrival order and persisted with a single write. The call
+    returns once the caller's update is on disk.
+
     Args:
         file_path: Path to JSON file
         update_fn: Function that takes data and returns updated data
@@ -71,10 +171,32 @@ def update_json_file(file_path, update_fn, default=None):
         
     Returns:
         bool: True if successful, False otherwise
+
+    Raises:
+        Exception: Whatever update_fn raised for this caller's update
     """
     if default is None:
         default = []
-    
-    data = load_json_file(file_path, default)
-    updated_data = update_fn(data)
-    return save_json_file(file_path, updated_data)
+
+    path = os.path.abspath(file_path)
+    with _registry_lock:
+        batch = _pending_batches.get(path)
+        is_leader = batch is None
+        if is_leader:
+            batch = _pending_batches[path] = _UpdateBatch()
+        index = len(batch.updates)
+        batch.updates.append(update_fn)
+
+    if is_leader:
+        try:
+            if WRITE_BEHIND_MS > 0:
+                time.sleep(WRITE_BEHIND_MS / 1000)
+            _commit_batch(file_path, batch, default)
+        finally:
+            batch.done.set()
+    else:
+        batch.done.wait()
+
+    if index in batch.errors:
+        raise batch.errors[index]
+    return batch.result
@@ -1,9 +1,15 @@
 """History management utilities for per-user prediction history"""
 import os
+import sys
 import uuid
 import logging
 from datetime import datetime
-from file_utils import load_json_file, save_json_file
+from file_utils import load_json_file, update_json_file
+from blob_utils import put_blob, release_blobs
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import FOOD_DATABASE
 
 logger = logging.getLogger(__name__)
 
@@ -16,30 +22,144 @@ def get_user_history_path(username):
     """Lấy đường dẫn file lịch sử cho một user cụ thể"""
     return os.path.join(HISTORY_DIR, f'{username.lower()}.json')
 
-def save_prediction_history(username, food_name, confidence, image_base64=None):
-    """Lưu lịch sử dự đoán cho user"""
+def get_user_stats_path(username):
+    """Lấy đường dẫn file thống kê (tổng hợp) lịch sử của user"""
+    return os.path.join(HISTORY_DIR, 'stats', f'{username.lower()}.json')
+
+def _image_ids(records):
+    """Lấy danh sách image_id (blob) được tham chiếu bởi các record"""
+    return [item['image_id'] for item in records if item.get('image_id')]
+
+def _empty_stats():
+    return {'total': 0, 'confidence_sum': 0.0, 'dishes': {}, 'regions': {}, 'activity': {}}
+
+def _bump(counts, key, delta):
+    """Cộng/trừ một bộ đếm, bỏ key khi về đúng 0 để file gọn
+
+    Bộ đếm có thể tạm âm (phần trừ của một lần xóa tới trước phần cộng của
+    lần lưu tương ứng); không kẹp về 0 để các cập nhật giao hoán được.
+    """
+    value = counts.get(key, 0) + delta
+    if value != 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+def _apply_records(stats, records, sign):
+    """
+    Cập nhật tổng hợp khi thêm (sign=1) hoặc xóa (sign=-1) các record
+
+    Mỗi thay đổi lịch sử cộng/trừ đúng các record nó thêm/xóa, nên thứ tự
+    ghi giữa file lịch sử và file thống kê không quan trọng (không cần khóa,
+    vẫn gộp ghi được).
+    """
+    for item in records:
+        food_name = item.get('food_name')
+        region = FOOD_DATABASE.get(food_name, {}).get('region', 'unknown')
+        stats['total'] += sign
+        stats['confidence_sum'] += sign * float(item.get('confidence') or 0)
+        _bump(stats['dishes'], food_name, sign)
+        _bump(stats['regions'], region, sign)
+        _bump(stats['activity'], (item.get('timestamp') or '')[:10], sign)
+    return stats
+
+def _update_stats(username, records, sign):
+    """Cập nhật tăng dần file thống kê của user"""
+    stats_path = get_user_stats_path(username)
+    
+    # Chưa có file thống kê (dữ liệu cũ) -> tính lại từ lịch sử đã cập nhật
+    if not os.path.exists(stats_path):
+        rebuild_history_stats(username)
+        return
+    
+    def apply(stats):
+        return _apply_records(stats, records, sign)
+    
+    if not update_json_file(stats_path, apply, default=_empty_stats()):
+        logger.error(f"Failed to update history stats for {username}")
+
+def init_history_stats(username):
+    """Tạo file thống kê rỗng cho user mới, để mọi cập nhật sau đều là cộng/trừ"""
+    if not update_json_file(get_user_stats_path(username), lambda stats: stats, default=_empty_stats()):
+        logger.error(f"Failed to create history stats for {username}")
+
+def rebuild_history_stats(username):
+    """
+    Tính lại thống kê từ file lịch sử (dùng cho dữ liệu cũ hoặc khi bị lệch)
+
+    Không giao hoán với các lần lưu/xóa đang chạy, nên chạy khi user
+    không hoạt động (xem rebuild_history_stats.py).
+    """
+    computed = []
+    
+    def recompute(_):
+        data = load_json_file(get_user_history_path(username), default=[])
+        computed.append(_apply_records(_empty_stats(), data, 1))
+        return computed[0]
+    
+    if not update_json_file(get_user_stats_path(username), recompute, default=_empty_stats()):
+        logger.error(f"Failed to rebuild history stats for {username}")
+    return computed[0] if computed else _empty_stats()
+
+def get_history_stats(username):
+    """Lấy thống kê lịch sử của user (đọc file tổng hợp, không quét lịch sử)"""
+    stats_path = get_user_stats_path(username)
+    if os.path.exists(stats_path):
+        stats = load_json_file(stats_path, default=_empty_stats())
+    else:
+        stats = rebuild_history_stats(username)
+    
+    # Bỏ các bộ đếm tạm âm/0 khi đang có lưu/xóa đồng thời
+    total = max(0, stats['total'])
+    activity = sorted((date, count) for date, count in stats['activity'].items() if count > 0)
+    return {
+        'total': total,
+        'average_confidence': round(stats['confidence_sum'] / total, 2) if total else 0,
+        'dishes': [
+            {'food_name': name, 'count': count}
+            for name, count in sorted(stats['dishes'].items(), key=lambda kv: -kv[1]) if count > 0
+        ],
+        'regions': {region: count for region, count in stats['regions'].items() if count > 0},
+        'activity': [{'date': date, 'count': count} for date, count in activity],
+        'first_date': activity[0][0] if activity else None,
+        'last_date': activity[-1][0] if activity else None
+    }
+
+def save_prediction_history(username, food_name, confidence, image_bytes=None):
+    """Lưu lịch sử dự đoán cho user (ảnh lưu trong blob store)"""
+    image_id = None
+    saved = False
     try:
+        if image_bytes:
+            image_id = put_blob(image_bytes)
+        
         record = {
             '_id': str(uuid.uuid4()),
             'timestamp': datetime.now().isoformat(),
             'food_name': food_name,
             'confidence': confidence,
-            'image_base64': image_base64
+            'image_id': image_id
         }
         
         user_history_path = get_user_history_path(username)
         
-        # Đọc dữ liệu hiện có
-        data = load_json_file(user_history_path, default=[])
-        data.append(record)
+        def append_record(data):
+            data.append(record)
+            return data
         
-        # Ghi lại file
-        if save_json_file(user_history_path, data):
+        # Ghi nối vào file (gộp với các ghi đồng thời khác)
+        saved = update_json_file(user_history_path, append_record, default=[])
+        if saved:
+            _update_stats(username, [record], 1)
             logger.info(f"History saved for user: {username}, food: {food_name}")
-        else:
-            logger.error(f"Failed to save history for {username}")
+            return
+        logger.error(f"Failed to save history for {username}")
     except Exception as e:
         logger.error(f"Failed to save history for {username}: {e}")
+    
+    # Record không được lưu -> bỏ tham chiếu tới ảnh
+    if image_id and not saved:
+        release_blobs([image_id])
 
 def get_prediction_history(username, limit=50):
     """Lấy lịch sử dự đoán của một user (mới nhất trước)"""
@@ -47,18 +167,28 @@ def get_prediction_history(username, limit=50):
     data = load_json_file(user_history_path, default=[])
     return data[-limit:][::-1]
 
+def user_owns_image(username, image_id):
+    """Kiểm tra ảnh có thuộc lịch sử của user không"""
+    user_history_path = get_user_history_path(username)
+    data = load_json_file(user_history_path, default=[])
+    return any(item.get('image_id') == image_id for item in data)
+
 def delete_history_item(username, item_id):
     """Xóa một record lịch sử theo ID"""
     user_history_path = get_user_history_path(username)
-    data = load_json_file(user_history_path, default=[])
+    removed = []
     
-    original_len = len(data)
-    data = [item for item in data if item.get('_id') != item_id]
+    def remove_item(data):
+        kept = [item for item in data if item.get('_id') != item_id]
+        removed.extend(item for item in data if item.get('_id') == item_id)
+        return kept
     
-    if len(data) == original_len:
+    if not update_json_file(user_history_path, remove_item, default=[]):
         return False
     
-    if save_json_file(user_history_path, data):
+    if removed:
+        _update_stats(username, removed, -1)
+        release_blobs(_image_ids(removed))
         logger.info(f"Deleted history item {item_id} for user: {username}")
         return True
     return False
@@ -66,8 +196,16 @@ def delete_history_item(username, item_id):
 def delete_all_history(username):
     """Xóa toàn bộ lịch sử của một user"""
     user_history_path = get_user_history_path(username)
+    removed = []
+    
+    def clear_all(data):
+        removed.extend(data)
+        return []
     
-    if save_json_file(user_history_path, []):
+    if update_json_file(user_history_path, clear_all, default=[]):
+        # Trừ đúng các record đã xóa (không reset), để giao hoán với các lần lưu đồng thời
+        _update_stats(username, removed, -1)
+        release_blobs(_image_ids(removed))
         logger.info(f"Cleared all history for user: {username}")
         return True
     logger.error(f"Failed to clear history for {username}")
@@ -0,0 +1,151 @@
+"""
+Persistent model artifact cache for fast cold starts
+
+warm_model_cache.py (run at deploy time, e.g. in Render's buildCommand)
+parses the HDF5 file with Keras and exports a SavedModel with a single
+concrete inference signature. The export is keyed by the .h5 file's SHA-256
+(plus precision), so server starts load the serialized graph and weights
+directly instead of rebuilding the Keras model layer by layer.
+
+The server never exports on its own start path: hosts like Render's free
+tier reset the filesystem on every spin-up, so a runtime export would only
+slow down each cold start. On a cache miss it falls back to the .h5 file.
+"""
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import logging
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+logger = logging.getLogger(__name__)
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import IMAGE_SIZE, MODEL_CACHE_DIR
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Set MODEL_CACHE=0 to always load straight from the .h5 file
+CACHE_ENABLED = os.getenv('MODEL_CACHE', '1') == '1'
+
+SIGNATURE_KEY = 'serving_default'
+OUTPUT_KEY = 'probabilities'
+
+
+class CachedModel:
+    """Inference-only wrapper exposing Keras-style predict() over a SavedModel signature"""
+
+    def __init__(self, loaded):
+        self._loaded = loaded
+        self._serve = loaded.signatures[SIGNATURE_KEY]
+
+    def predict(self, x, batch_size=None, verbose=0):
+        batch_size = batch_size or len(x)
+        outputs = [
+            self._serve(images=tf.constant(x[i:i + batch_size], dtype=tf.float32))[OUTPUT_KEY].numpy()
+            for i in range(0, len(x), batch_size)
+        ]
+        return np.concatenate(outputs, axis=0)
+
+    def __call__(self, x, training=False):
+        return self._serve(images=tf.convert_to_tensor(x, dtype=tf.float32))[OUTPUT_KEY]
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Hash a file in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_saved_model(model, export_path):
+    """Export a Keras model as a SavedModel with a fixed inference signature"""
+    module = tf.Module()
+    module.model = model
+
+    @tf.function(input_signature=[
+        tf.TensorSpec([None, IMAGE_SIZE[0], IMAGE_SIZE[1], 3], tf.float32, name='images')
+    ])
+    def serve(images):
+        return {OUTPUT_KEY: tf.cast(model(images, training=False), tf.float32)}
+
+    module.serve = serve
+
+    # Export to a temp dir and rename so a crash never leaves a half-written cache
+    parent = os.path.dirname(export_path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.export-', dir=parent)
+    try:
+        tf.saved_model.save(module, tmp_path, signatures={SIGNATURE_KEY: serve})
+        os.replace(tmp_path, export_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def load_model_artifact(model_path, convert_fn=None, variant='float32', export=False):
+    """
+    Load a model, preferring the cached SavedModel for this .h5 file
+
+    Args:
+        model_path: Path to the .h5 model
+        convert_fn: Optional function applied to the Keras model before export
+        variant: Cache variant name (e.g. precision) so conversions are cached separately
+        export: Export the SavedModel on a cache miss (deploy-time warm-up only)
+
+    Returns:
+        Keras model or CachedModel, both providing predict(x, batch_size=None, verbose=0)
+    """
+    start = time.perf_counter()
+
+    if not CACHE_ENABLED:
+        model = load_model(model_path, compile=False)
+        if convert_fn:
+            model = convert_fn(model)
+        logger.info(f"Model built from {model_path} in {time.perf_counter() - start:.2f}s (cache disabled)")
+        return model
+
+    digest = file_sha256(model_path)
+    hash_time = time.perf_counter() - start
+    cache_path = os.path.join(BASE_DIR, MODEL_CACHE_DIR, f"{digest[:16]}-{variant}")
+
+    if os.path.isdir(cache_path):
+        try:
+            model = CachedModel(tf.saved_model.load(cache_path))
+            logger.info(
+                f"Model loaded from cache {cache_path} in {time.perf_counter() - start:.2f}s "
+                f"(hash {hash_time:.2f}s)"
+            )
+            return model
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable model cache {cache_path}: {e}")
+            shutil.rmtree(cache_path, ignore_errors=True)
+
+    model = load_model(model_path, compile=False)
+    if convert_fn:
+        model = convert_fn(model)
+    build_time = time.perf_counter() - start
+
+    if not export:
+        logger.info(
+            f"Model built from {model_path} in {build_time:.2f}s (no cached artifact, "
+            f"run backend/warm_model_cache.py at deploy time)"
+        )
+        return model
+
+    try:
+        export_saved_model(model, cache_path)
+        logger.info(
+            f"Model built from {model_path} in {build_time:.2f}s, cached to {cache_path} "
+            f"in {time.perf_counter() - start - build_time:.2f}s"
+        )
+    except Exception as e:
+        logger.warning(f"Failed to cache model artifact (built in {build_time:.2f}s): {e}")
+
+    return model
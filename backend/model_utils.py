@@ -4,47 +4,239 @@ Centralized model management to avoid code duplication
 """
 import os
 import sys
+import io
 import json
+import platform
+import subprocess
+import time
 import numpy as np
 from PIL import Image
-from tensorflow.keras.models import load_model
-from tensorflow.keras.applications.inception_v3 import preprocess_input
+import tensorflow as tf
+from tensorflow.keras.models import clone_model
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import FOOD_DATABASE, MODEL_PATH, IMAGE_SIZE
+from config import (
+    FOOD_DATABASE, MODEL_PATH, IMAGE_SIZE, BATCH_SIZE, TUNING_PROFILE_PATH,
+    DEFAULT_MODEL, MODEL_REGISTRY
+)
+from model_cache_utils import load_model_artifact
+from registry_utils import ModelRegistry, ShadowEvaluator
+
+# Memory allowed for models loaded at once (registry evicts LRU beyond this)
+MODEL_MEMORY_BUDGET_MB = int(os.getenv('MODEL_MEMORY_BUDGET_MB', 256))
+# Candidate model replayed asynchronously on a share of live traffic
+SHADOW_MODEL = os.getenv('SHADOW_MODEL', '')
+SHADOW_FRACTION = float(os.getenv('SHADOW_FRACTION', 0.1))
+# Models anonymous callers may select with 'model' (logged-in users can pick any),
+# so anonymous traffic can't force repeated loads and evictions
+ROUTABLE_MODELS = [name.strip() for name in os.getenv('ROUTABLE_MODELS', '').split(',') if name.strip()]
 
 # Global cache
-_model = None
+_registry = None
+_shadow = None
+_runtime_configured = False
 _food_classes_cache = None
+_tuning_profile = None
+
+# Adjust paths to go from backend/ to root directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-def load_ml_model():
-    """Load TensorFlow model (singleton pattern)"""
-    global _model
+def get_cpu_signature():
+    """Identify the CPU so a tuning profile is only reused on the same machine type"""
+    cpu_model = platform.processor() or platform.machine()
+    flags = set()
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name') and ':' in line:
+                    cpu_model = line.split(':', 1)[1].strip()
+                elif line.startswith('flags') and ':' in line:
+                    flags = set(line.split(':', 1)[1].split())
+                if flags and cpu_model:
+                    break
+    except OSError:
+        pass
+    
+    return {
+        'model': cpu_model,
+        'cpu_count': os.cpu_count() or 1,
+        'bf16': bool(flags & {'avx512_bf16', 'amx_bf16'})
+    }
+
+
+def get_tuning_profile():
+    """
+    Load the CPU inference profile written by autotune.py (cached)
+    
+    Returns:
+        dict: Tuned settings, or {} if missing or tuned on a different CPU
+    """
+    global _tuning_profile
+    
+    if _tuning_profile is not None:
+        return _tuning_profile
     
-    if _model is not None:
-        return _model
+    profile_path = os.path.join(BASE_DIR, TUNING_PROFILE_PATH)
+    profile = {}
+    if os.path.exists(profile_path):
+        try:
+            with open(profile_path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.warning(f"Failed to read tuning profile {profile_path}: {e}")
     
+    if profile and profile.get('cpu') != get_cpu_signature():
+        logger.warning("Tuning profile was created on a different CPU, using defaults")
+        profile = {}
+    
+    _tuning_profile = profile
+    return _tuning_profile
+
+
+def apply_tuning_profile(profile):
+    """Apply thread counts and XLA setting (must run before the first TF op)"""
     try:
-        # Adjust path to go from backend/ to root directory
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        model_path = os.path.join(base_dir, MODEL_PATH)
-        
-        if os.path.exists(model_path):
-            _model = load_model(model_path, compile=False)
-            logger.info(f"Model loaded successfully from {model_path}")
-        else:
+        if profile.get('intra_op_threads'):
+            tf.config.threading.set_intra_op_parallelism_threads(profile['intra_op_threads'])
+        if profile.get('inter_op_threads'):
+            tf.config.threading.set_inter_op_parallelism_threads(profile['inter_op_threads'])
+    except RuntimeError as e:
+        logger.warning(f"Could not set thread counts, TF runtime already initialized: {e}")
+    
+    tf.config.optimizer.set_jit(bool(profile.get('xla', False)))
+
+
+def to_mixed_bfloat16(model):
+    """Rebuild model with mixed_bfloat16 layers, keeping the output layer in float32"""
+    output_layer = model.layers[-1].name
+    
+    def clone_layer(layer):
+        config = layer.get_config()
+        if layer.name != output_layer:
+            config['dtype'] = 'mixed_bfloat16'
+        return layer.__class__.from_config(config)
+    
+    mixed = clone_model(model, clone_function=clone_layer)
+    mixed.set_weights(model.get_weights())
+    return mixed
+
+
+def run_autotune():
+    """Run autotune.py in a subprocess (first boot) and reload the profile"""
+    global _tuning_profile
+    
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autotune.py')
+    logger.info("No tuning profile found, running auto-tune (AUTOTUNE_ON_BOOT=1)")
+    result = subprocess.run([sys.executable, script])
+    if result.returncode != 0:
+        logger.warning("Auto-tune failed, using default inference settings")
+    
+    _tuning_profile = None
+    return get_tuning_profile()
+
+
+def get_batch_size():
+    """
+    Micro-batch size for batched inference (tuned if a profile exists)
+    
+    Only offline batch jobs (tests/evaluate.py) use this; the API predicts
+    one image per request.
+    """
+    return get_tuning_profile().get('batch_size', BATCH_SIZE)
+
+
+def _configure_runtime():
+    """Apply the tuning profile once, before the first model is built"""
+    global _runtime_configured
+    
+    if _runtime_configured:
+        return
+    _runtime_configured = True
+    
+    profile = get_tuning_profile()
+    if not profile and os.getenv('AUTOTUNE_ON_BOOT', '0') == '1':
+        profile = run_autotune()
+    if profile:
+        apply_tuning_profile(profile)
+        logger.info(
+            f"Applied tuning profile: intra={profile.get('intra_op_threads')}, "
+            f"inter={profile.get('inter_op_threads')}, xla={profile.get('xla')}, "
+            f"precision={profile.get('precision')}, batch={profile.get('batch_size')}"
+        )
+
+
+def build_model(model_path, export_cache=False):
+    """
+    Load a model file with the tuning profile and artifact cache applied
+    
+    Args:
+        model_path: Path to the .h5 model
+        export_cache: Write the SavedModel artifact on a cache miss (warm_model_cache.py)
+    """
+    try:
+        if not os.path.exists(model_path):
             logger.error(f"Model not found at {model_path}")
             raise FileNotFoundError(f"Model not found at {model_path}")
+        
+        _configure_runtime()
+        precision = get_tuning_profile().get('precision', 'float32')
+        model = load_model_artifact(
+            model_path,
+            convert_fn=to_mixed_bfloat16 if precision == 'mixed_bfloat16' else None,
+            variant=precision,
+            export=export_cache
+        )
+        logger.info(f"Model loaded successfully from {model_path}")
+        return model
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
         raise
+
+
+def get_model_registry():
+    """Get the model registry (singleton)"""
+    global _registry
     
-    return _model
+    if _registry is None:
+        _registry = ModelRegistry(
+            {name: os.path.join(BASE_DIR, path) for name, path in MODEL_REGISTRY.items()},
+            budget_bytes=MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+            loader=build_model,
+            pinned=[DEFAULT_MODEL]
+        )
+    return _registry
+
+
+def get_shadow_evaluator():
+    """Get the shadow evaluator, or None if SHADOW_MODEL isn't set"""
+    global _shadow
+    
+    if _shadow is None and SHADOW_MODEL:
+        if SHADOW_MODEL not in MODEL_REGISTRY:
+            logger.error(f"SHADOW_MODEL '{SHADOW_MODEL}' is not a registered model")
+            return None
+        _shadow = ShadowEvaluator(get_model_registry(), SHADOW_MODEL, SHADOW_FRACTION)
+        logger.info(f"Shadowing {SHADOW_FRACTION:.0%} of traffic onto '{SHADOW_MODEL}'")
+    return _shadow
+
+
+def get_model_names(authenticated=False):
+    """Names of models that requests can be routed to (anonymous: default + ROUTABLE_MODELS)"""
+    if authenticated:
+        return list(MODEL_REGISTRY)
+    return [DEFAULT_MODEL] + [
+        name for name in ROUTABLE_MODELS if name in MODEL_REGISTRY and name != DEFAULT_MODEL
+    ]
+
+
+def load_ml_model(name=None):
+    """Load a model by registry name (default model if None)"""
+    return get_model_registry().get(name or DEFAULT_MODEL)
 
 
 def get_food_classes():
@@ -55,30 +247,106 @@ def get_food_classes():
     return _food_classes_cache
 
 
+def preprocess_pixels(pixels, out=None):
+    """
+    Scale a uint8 HxWx3 array to InceptionV3 input range [-1, 1]
+    
+    Same result as preprocess_input (mode 'tf'), but writes straight into
+    a single float32 batch buffer instead of creating intermediate copies.
+    
+    Args:
+        pixels: uint8 HxWx3 array
+        out: Optional preallocated 1xHxWx3 float32 buffer to fill
+    """
+    img_array = np.empty((1,) + pixels.shape, dtype=np.float32) if out is None else out
+    np.multiply(pixels, np.float32(1 / 127.5), out=img_array[0], dtype=np.float32)
+    img_array -= 1.0
+    return img_array
+
+
 def preprocess_image_data(img):
     """Preprocess PIL Image for InceptionV3 prediction"""
     img = img.resize(IMAGE_SIZE)
-    img_array = np.array(img, dtype=np.float32)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
-    return img_array
+    return preprocess_pixels(np.asarray(img, dtype=np.uint8))
 
 
-def predict_image(img, top_k=4):
+def pixels_from_buffer(buffer, shape_header):
     """
-    Predict food from PIL Image
+    View a raw uint8 RGB buffer (already resized on the client) as an array
     
     Args:
-        img: PIL Image object
-        top_k: Number of top predictions to return
+        buffer: Request body bytes
+        shape_header: Shape as "height,width,channels" (must match IMAGE_SIZE x 3)
         
     Returns:
-        tuple: (top_food_name, confidence, related_foods_list)
+        np.ndarray: Read-only HxWx3 uint8 view over buffer (no copy)
+        
+    Raises:
+        ValueError: If the shape is missing, wrong, or doesn't match the buffer
+    """
+    expected = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+    try:
+        shape = tuple(int(dim) for dim in (shape_header or '').split(','))
+    except ValueError:
+        raise ValueError("Invalid X-Image-Shape header, expected 'height,width,3'")
+    
+    if shape != expected:
+        raise ValueError(f"Image shape must be {expected[0]},{expected[1]},{expected[2]}")
+    if len(buffer) != expected[0] * expected[1] * expected[2]:
+        raise ValueError(f"Expected {expected[0] * expected[1] * expected[2]} bytes, got {len(buffer)}")
+    
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(expected)
+
+
+def pixels_from_jpeg(data):
     """
-    model = load_ml_model()
+    Decode a JPEG that was already resized to IMAGE_SIZE on the client
+    
+    Raises:
+        ValueError: If the data isn't a JPEG of exactly IMAGE_SIZE
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Exception:
+        raise ValueError("Invalid JPEG data")
+    
+    if img.format != 'JPEG':
+        raise ValueError("Image must be a JPEG")
+    if img.size != IMAGE_SIZE:
+        raise ValueError(f"JPEG must be {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}, got {img.size[0]}x{img.size[1]}")
+    
+    # Image.open only reads the header; decode now so truncated data is a client error
+    try:
+        img.load()
+    except OSError as e:
+        raise ValueError(f"Invalid JPEG data: {e}")
     
-    img_array = preprocess_image_data(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return np.asarray(img, dtype=np.uint8)
+
+
+def predict_array(img_array, top_k=4, model_name=None):
+    """
+    Predict food from a preprocessed 1xHxWx3 float32 batch
+    
+    Args:
+        img_array: Preprocessed batch of one image
+        top_k: Number of top predictions to return
+        model_name: Registry model to use (default model if None)
+    
+    Returns:
+        tuple: (top_food_name, confidence, related_foods_list)
+    """
+    model_name = model_name or DEFAULT_MODEL
+    model = load_ml_model(model_name)
+    start = time.perf_counter()
     pred_probs = model.predict(img_array, verbose=0)[0]
+    latency = time.perf_counter() - start
+    
+    shadow = get_shadow_evaluator()
+    if shadow and shadow.candidate != model_name:
+        shadow.maybe_submit(img_array, int(np.argmax(pred_probs)), latency)
     
     classes = get_food_classes()
     top_indices = np.argpartition(pred_probs, -top_k)[-top_k:]
@@ -91,6 +359,26 @@ def predict_image(img, top_k=4):
     return food_name, confidence, related
 
 
+def predict_pixels(pixels, top_k=4, model_name=None):
+    """Predict food from a uint8 HxWx3 array already at IMAGE_SIZE"""
+    return predict_array(preprocess_pixels(pixels), top_k=top_k, model_name=model_name)
+
+
+def predict_image(img, top_k=4, model_name=None):
+    """
+    Predict food from PIL Image
+    
+    Args:
+        img: PIL Image object
+        top_k: Number of top predictions to return
+        model_name: Registry model to use (default model if None)
+        
+    Returns:
+        tuple: (top_food_name, confidence, related_foods_list)
+    """
+    return predict_array(preprocess_image_data(img), top_k=top_k, model_name=model_name)
+
+
 def get_food_info(food_name, lang='VN'):
     """Get food information in specified language"""
     if food_name not in FOOD_DATABASE:
@@ -0,0 +1,35 @@
+"""
+Rebuild per-user history statistics
+
+Recomputes the aggregates behind /api/history/stats from the history
+files. Use after upgrading (existing users have no stats yet) or if the
+stats ever drift from the history, e.g. after a crash between the two
+writes.
+
+Usage:
+    python backend/rebuild_history_stats.py [username ...]
+"""
+import os
+import sys
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+from history_utils import HISTORY_DIR, rebuild_history_stats
+
+
+def main():
+    usernames = sys.argv[1:] or [
+        f[:-len('.json')] for f in sorted(os.listdir(HISTORY_DIR))
+        if f.endswith('.json') and os.path.isfile(os.path.join(HISTORY_DIR, f))
+    ]
+
+    for username in usernames:
+        stats = rebuild_history_stats(username)
+        logger.info(f"Rebuilt stats for {username}: {stats['total']} predictions")
+    logger.info(f"Done ({len(usernames)} users)")
+
+
+if __name__ == '__main__':
+    main()
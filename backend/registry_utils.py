@@ -0,0 +1,194 @@
+"""
+Multi-model registry and shadow evaluation
+
+ModelRegistry keeps several models loaded by name under a memory budget,
+evicting the least recently used ones (pinned models are never evicted).
+ShadowEvaluator replays a sample of live requests on a candidate model in a
+background thread and records agreement and latency against the primary.
+"""
+import os
+import time
+import random
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Load models by name on demand, with LRU eviction under a memory budget"""
+
+    def __init__(self, model_paths, budget_bytes, loader, pinned=()):
+        """
+        Args:
+            model_paths: Dict of model name -> model file path
+            budget_bytes: Total memory allowed for loaded models
+            loader: Function taking a model path and returning a model
+            pinned: Names that are never evicted (e.g. the default model)
+        """
+        self.model_paths = model_paths
+        self.budget_bytes = budget_bytes
+        self.loader = loader
+        self.pinned = set(pinned)
+        self._models = OrderedDict()  # name -> (model, size_bytes), oldest first
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in model_paths}
+
+    def estimate_size(self, name):
+        """
+        Approximate resident size of a model: its .h5 file size
+
+        The checkpoints include optimizer state for their trainable layers
+        (fine-tune files are ~141MB vs ~97MB for the base ones, while the
+        InceptionV3 weights alone are ~92MB), so this overestimates what
+        inference keeps in memory and errs on the side of evicting early.
+        """
+        return os.path.getsize(self.model_paths[name])
+
+    def get(self, name):
+        """
+        Get a loaded model, loading (and evicting others) if needed
+
+        Raises:
+            KeyError: If name isn't a registered model
+        """
+        if name not in self.model_paths:
+            raise KeyError(f"Unknown model: {name}")
+
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name][0]
+
+        # Only one thread loads a given model; others wait for it
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    return self._models[name][0]
+
+            size = self.estimate_size(name)
+            with self._lock:
+                self._evict_for(size)
+
+            start = time.perf_counter()
+            model = self.loader(self.model_paths[name])
+            logger.info(f"Registry loaded model '{name}' ({size / 2**20:.0f}MB) "
+                        f"in {time.perf_counter() - start:.2f}s")
+
+            with self._lock:
+                self._models[name] = (model, size)
+            return model
+
+    def _evict_for(self, size):
+        """Evict least recently used, unpinned models until size fits (caller holds lock)"""
+        used = sum(s for _, s in self._models.values())
+        for name in list(self._models):
+            if used + size <= self.budget_bytes:
+                break
+            if name in self.pinned:
+                continue
+            used -= self._models.pop(name)[1]
+            logger.info(f"Registry evicted model '{name}' to stay within memory budget")
+
+        if used + size > self.budget_bytes:
+            logger.warning(f"Model memory budget exceeded: {(used + size) / 2**20:.0f}MB "
+                           f"> {self.budget_bytes / 2**20:.0f}MB")
+
+    def status(self):
+        """Registered models, which are loaded, and memory use"""
+        with self._lock:
+            loaded = {name: size for name, (_, size) in self._models.items()}
+        return {
+            'models': list(self.model_paths),
+            'loaded': list(loaded),
+            'memory_used_mb': round(sum(loaded.values()) / 2**20, 1),
+            'memory_budget_mb': round(self.budget_bytes / 2**20, 1)
+        }
+
+
+class ShadowEvaluator:
+    """Asynchronously compare a candidate model against the primary on live traffic"""
+
+    def __init__(self, registry, candidate, fraction, max_pending=4, window=1000):
+        """
+        Args:
+            registry: ModelRegistry to load the candidate from
+            candidate: Name of the shadow model
+            fraction: Share of requests (0-1) replayed on the candidate
+            max_pending: Shadow jobs allowed in flight; extra samples are dropped
+            window: Number of recent latencies kept for percentiles
+        """
+        self.registry = registry
+        self.candidate = candidate
+        self.fraction = fraction
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.compared = 0
+        self.agreed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.primary_latencies = deque(maxlen=window)
+        self.shadow_latencies = deque(maxlen=window)
+
+    def maybe_submit(self, img_array, primary_top, primary_latency):
+        """Sample this request for shadowing; never blocks the caller
+
+        img_array is copied when sampled, since callers may reuse the buffer
+        (e.g. a shared-memory decode slot) as soon as this returns.
+        """
+        if self.fraction <= 0 or random.random() >= self.fraction:
+            return
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending += 1
+        self._executor.submit(self._run, np.array(img_array, copy=True), primary_top, primary_latency)
+
+    def _run(self, img_array, primary_top, primary_latency):
+        try:
+            model = self.registry.get(self.candidate)
+            start = time.perf_counter()
+            probs = model.predict(img_array, verbose=0)[0]
+            latency = time.perf_counter() - start
+
+            with self._lock:
+                self.compared += 1
+                self.agreed += int(int(np.argmax(probs)) == primary_top)
+                self.primary_latencies.append(primary_latency)
+                self.shadow_latencies.append(latency)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning(f"Shadow prediction on '{self.candidate}' failed: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @staticmethod
+    def _percentiles(latencies):
+        if not latencies:
+            return None
+        values = np.array(latencies) * 1000
+        return {'p50_ms': round(float(np.percentile(values, 50)), 1),
+                'p99_ms': round(float(np.percentile(values, 99)), 1)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'candidate': self.candidate,
+                'fraction': self.fraction,
+                'compared': self.compared,
+                'agreement': round(self.agreed / self.compared, 4) if self.compared else None,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'primary_latency': self._percentiles(self.primary_latencies),
+                'shadow_latency': self._percentiles(self.shadow_latencies)
+            }
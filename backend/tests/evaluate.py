@@ -0,0 +1,238 @@
+"""Test Set Evaluation
+
+Evaluates a model on the test split (one sub-folder per class) and writes
+accuracy, top-k, per-class metrics, confusion matrix and throughput into
+Models/InceptionV3/metrics.json.
+
+The first run decodes and resizes every image once (in parallel) into
+uint8 .npy shards under Models/InceptionV3/eval_cache/. Later runs, e.g.
+for a new checkpoint, memory-map those shards and stream them through a
+parallel, prefetching tf.data pipeline, so no JPEG is decoded again.
+
+Usage:
+    python backend/tests/evaluate.py --data-dir path/to/Test [--model fine_tune_best]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+# Add project root and backend to path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'backend'))
+
+from config import IMAGE_SIZE, MODEL_REGISTRY, DEFAULT_MODEL
+
+CLASS_MAPPING_FILE = os.path.join(PROJECT_ROOT, "Models", "InceptionV3", "class_mapping.json")
+METRICS_FILE = os.path.join(PROJECT_ROOT, "Models", "InceptionV3", "metrics.json")
+CACHE_ROOT = os.path.join(PROJECT_ROOT, "Models", "InceptionV3", "eval_cache")
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+SHARD_SIZE = 512
+TOP_K = (3, 5)
+
+
+def list_dataset(data_dir, class_names):
+    """Collect (path, label) pairs from class sub-folders"""
+    index = {name: i for i, name in enumerate(class_names)}
+    samples = []
+    for folder in sorted(os.listdir(data_dir)):
+        folder_path = os.path.join(data_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        if folder not in index:
+            print(f"⚠ Skipping unknown class folder: {folder}")
+            continue
+        for f in sorted(os.listdir(folder_path)):
+            if f.lower().endswith(EXTENSIONS):
+                samples.append((os.path.join(folder_path, f), index[folder]))
+    return samples
+
+
+def cache_key(samples):
+    """Key the cache on file list, sizes, mtimes and target size"""
+    digest = hashlib.sha256(repr(IMAGE_SIZE).encode())
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def decode_image(path):
+    """Decode + resize one image to uint8 (same steps as the API)"""
+    img = Image.open(path).convert('RGB').resize(IMAGE_SIZE)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def build_cache(samples, cache_dir, workers):
+    """Decode all images once into uint8 .npy shards"""
+    os.makedirs(cache_dir, exist_ok=True)
+    shape = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+    start = time.time()
+
+    with Pool(workers) as pool:
+        for shard, offset in enumerate(range(0, len(samples), SHARD_SIZE)):
+            chunk = samples[offset:offset + SHARD_SIZE]
+            images = np.lib.format.open_memmap(
+                os.path.join(cache_dir, f"shard_{shard:03d}_images.npy"),
+                mode='w+', dtype=np.uint8, shape=(len(chunk),) + shape
+            )
+            for i, pixels in enumerate(pool.imap(decode_image, [p for p, _ in chunk], chunksize=8)):
+                images[i] = pixels
+            images.flush()
+            del images
+            np.save(os.path.join(cache_dir, f"shard_{shard:03d}_labels.npy"),
+                    np.array([label for _, label in chunk], dtype=np.int32))
+            print(f"  shard {shard}: {offset + len(chunk)}/{len(samples)} images")
+
+    with open(os.path.join(cache_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'num_images': len(samples), 'shard_size': SHARD_SIZE,
+                   'image_size': list(IMAGE_SIZE)}, f)
+    return time.time() - start
+
+
+def make_dataset(cache_dir, batch_size):
+    """Stream memory-mapped shards through a parallel, prefetching tf.data pipeline"""
+    import tensorflow as tf
+
+    with open(os.path.join(cache_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    num_shards = (manifest['num_images'] + manifest['shard_size'] - 1) // manifest['shard_size']
+    shape = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+
+    def read_shard(shard):
+        images = np.load(os.path.join(cache_dir, f"shard_{shard:03d}_images.npy"), mmap_mode='r')
+        labels = np.load(os.path.join(cache_dir, f"shard_{shard:03d}_labels.npy"))
+        for i in range(0, len(labels), batch_size):
+            yield images[i:i + batch_size], labels[i:i + batch_size]
+
+    def shard_dataset(shard):
+        return tf.data.Dataset.from_generator(
+            read_shard, args=(shard,),
+            output_signature=(tf.TensorSpec((None,) + shape, tf.uint8), tf.TensorSpec((None,), tf.int32))
+        )
+
+    def preprocess(images, labels):
+        # Same scaling as model_utils.preprocess_pixels (InceptionV3 'tf' mode)
+        return tf.cast(images, tf.float32) / 127.5 - 1.0, labels
+
+    return (
+        tf.data.Dataset.range(num_shards)
+        .interleave(shard_dataset, cycle_length=min(4, num_shards),
+                    num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+        .map(preprocess, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def run_inference(model, dataset):
+    """Batched inference over the pipeline, returning (probs, labels, seconds)"""
+    all_probs, all_labels = [], []
+    start = time.time()
+    for images, labels in dataset:
+        all_probs.append(np.asarray(model(images, training=False)))
+        all_labels.append(labels.numpy())
+    return np.concatenate(all_probs), np.concatenate(all_labels), time.time() - start
+
+
+def compute_metrics(probs, labels, class_names):
+    from sklearn.metrics import classification_report, confusion_matrix
+
+    preds = probs.argmax(axis=1)
+    ranked = np.argsort(probs, axis=1)[:, ::-1]
+    metrics = {'accuracy': round(float(np.mean(preds == labels)), 4)}
+    for k in TOP_K:
+        metrics[f'top_{k}_accuracy'] = round(float(np.mean((ranked[:, :k] == labels[:, None]).any(axis=1))), 4)
+
+    indices = list(range(len(class_names)))
+    report = classification_report(labels, preds, labels=indices, target_names=class_names,
+                                   output_dict=True, zero_division=0)
+    metrics['per_class'] = {
+        name: {key: round(float(report[name][key]), 4) if key != 'support' else int(report[name][key])
+               for key in ('precision', 'recall', 'f1-score', 'support')}
+        for name in class_names
+    }
+    metrics['macro_f1'] = round(float(report['macro avg']['f1-score']), 4)
+    metrics['confusion_matrix'] = confusion_matrix(labels, preds, labels=indices).tolist()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate a model on the test split')
+    parser.add_argument('--data-dir', required=True, help='Test split folder (one sub-folder per class)')
+    parser.add_argument('--model', default=DEFAULT_MODEL, choices=list(MODEL_REGISTRY),
+                        help=f'Registered model to evaluate (default: {DEFAULT_MODEL})')
+    parser.add_argument('--model-path', help='Evaluate this .h5 file instead of a registered model')
+    parser.add_argument('--batch-size', type=int, help='Inference batch size (default: tuned or config)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Decode processes for the first run')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Decode images again even if cached')
+    parser.add_argument('--output', default=METRICS_FILE, help='Metrics JSON to update')
+    args = parser.parse_args()
+
+    with open(CLASS_MAPPING_FILE, 'r', encoding='utf-8') as f:
+        class_mapping = json.load(f)
+    class_names = [class_mapping[str(i)] for i in range(len(class_mapping))]
+
+    samples = list_dataset(args.data_dir, class_names)
+    if not samples:
+        print("No images found")
+        return
+    print(f"✓ Found {len(samples)} images in {len(class_names)} classes")
+
+    cache_dir = os.path.join(CACHE_ROOT, cache_key(samples))
+    cache_hit = os.path.exists(os.path.join(cache_dir, 'manifest.json')) and not args.rebuild_cache
+    if cache_hit:
+        decode_time = 0.0
+        print(f"✓ Using cached shards: {cache_dir}")
+    else:
+        print(f"Decoding images into shards ({args.workers} workers)...")
+        decode_time = build_cache(samples, cache_dir, args.workers)
+        print(f"✓ Cached in {decode_time:.1f}s: {cache_dir}")
+
+    from model_utils import build_model, get_batch_size
+    model_path = args.model_path or os.path.join(PROJECT_ROOT, MODEL_REGISTRY[args.model])
+    print("Loading model...")
+    model = build_model(model_path)
+    batch_size = args.batch_size or get_batch_size()
+
+    probs, labels, infer_time = run_inference(model, make_dataset(cache_dir, batch_size))
+    metrics = compute_metrics(probs, labels, class_names)
+
+    print(f"\nAccuracy: {metrics['accuracy'] * 100:.2f}%")
+    for k in TOP_K:
+        print(f"Top-{k}: {metrics[f'top_{k}_accuracy'] * 100:.2f}%")
+    print(f"Macro F1: {metrics['macro_f1']:.4f}")
+    print(f"Throughput: {len(labels) / infer_time:.1f} img/s (batch {batch_size})")
+
+    results = {}
+    if os.path.exists(args.output):
+        with open(args.output, 'r', encoding='utf-8') as f:
+            results = json.load(f)
+    results.pop('note', None)
+    results.update({
+        'evaluation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'model_path': os.path.relpath(model_path, PROJECT_ROOT),
+        'test_images': int(len(labels)),
+        **metrics,
+        'throughput': {
+            'images_per_second': round(len(labels) / infer_time, 2),
+            'inference_seconds': round(infer_time, 2),
+            'decode_seconds': round(decode_time, 2),
+            'batch_size': batch_size,
+            'cache_hit': cache_hit
+        }
+    })
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"✓ Saved: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""History Stats Consistency Test
+
+Races concurrent saves against delete-all / single deletes on one user and
+checks that the incrementally maintained stats (/api/history/stats) always
+match the history they summarize. Runs against a throwaway data directory.
+
+Usage:
+    python backend/tests/history_stats_test.py [--trials 30]
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import threading
+
+# Add project root and backend to path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'backend'))
+
+import history_utils
+import blob_utils
+
+FOODS = ['Phở', 'Bún bò Huế', 'Bánh mì', 'Cơm tấm', 'Bánh xèo']
+
+
+def use_data_dir(data_dir):
+    history_utils.HISTORY_DIR = os.path.join(data_dir, 'history')
+    os.makedirs(history_utils.HISTORY_DIR, exist_ok=True)
+    blob_utils.BLOB_DIR = os.path.join(data_dir, 'blobs')
+    blob_utils.INDEX_PATH = os.path.join(blob_utils.BLOB_DIR, 'index.json')
+    blob_utils.LOG_PATH = os.path.join(blob_utils.BLOB_DIR, 'index.log')
+    blob_utils._index = None
+
+
+def run_concurrently(jobs):
+    barrier = threading.Barrier(len(jobs))
+
+    def run(job):
+        barrier.wait()
+        job()
+
+    threads = [threading.Thread(target=run, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def check(username):
+    """Return None if stats match history, else a description of the drift"""
+    history = history_utils.get_prediction_history(username, limit=10 ** 6)
+    stats = history_utils.get_history_stats(username)
+    expected = history_utils._apply_records(history_utils._empty_stats(), history, 1)
+    if stats['total'] != len(history) or dict(stats['regions']) != expected['regions']:
+        return f"stats total {stats['total']} vs {len(history)} records"
+    return None
+
+
+def trial(username, rng):
+    # Seed a few records so single deletes have something to race with
+    for _ in range(3):
+        history_utils.save_prediction_history(username, rng.choice(FOODS), 90.0, image_bytes=os.urandom(64))
+    existing = [item['_id'] for item in history_utils.get_prediction_history(username)]
+
+    jobs = [
+        lambda: history_utils.save_prediction_history(username, rng.choice(FOODS), 80.0,
+                                                      image_bytes=os.urandom(64))
+        for _ in range(5)
+    ]
+    jobs.append(lambda: history_utils.delete_all_history(username))
+    jobs.append(lambda: history_utils.delete_history_item(username, rng.choice(existing)))
+    rng.shuffle(jobs)
+    run_concurrently(jobs)
+    return check(username)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent history/stats consistency test')
+    parser.add_argument('--trials', type=int, default=30)
+    args = parser.parse_args()
+
+    use_data_dir(tempfile.mkdtemp(prefix='vnfoods-history-'))
+    rng = random.Random(0)
+
+    failures = 0
+    for i in range(args.trials):
+        problem = trial(f'statsuser{i}', rng)
+        if problem:
+            failures += 1
+            print(f"✗ Trial {i}: {problem}")
+
+    if failures:
+        print(f"\n✗ Stats drifted from history in {failures}/{args.trials} trials")
+        sys.exit(1)
+    print(f"✓ Stats matched history in all {args.trials} trials")
+
+
+if __name__ == '__main__':
+    main()
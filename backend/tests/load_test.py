@@ -0,0 +1,443 @@
+"""Local Load Test
+
+Starts the API in a subprocess (stub or real model, Flask or ASGI server,
+throwaway data directory) and replays a weighted mix of realistic traffic
+at increasing concurrency. Reports throughput, p50/p99 latency, error and
+429 rates and server memory (PSS of the server and its decode workers)
+per concurrency step.
+
+Usage:
+    python backend/tests/load_test.py --server asgi --ramp 1,4,16,64 --duration 20
+    python backend/tests/load_test.py --url http://localhost:5000   # existing server
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.parse
+import urllib.request
+import urllib.error
+
+import numpy as np
+from PIL import Image
+
+# Add project root and backend to path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BACKEND_DIR = os.path.join(PROJECT_ROOT, 'backend')
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_MIX = 'predict_anon=2,predict_auth=3,search=3,history_get=1.5,history_delete=0.5,login=0.5,refresh=0.5'
+PHOTO_SIZES = [(640, 480), (1280, 960), (1920, 1440)]
+SEARCH_TERMS = ['', 'phở', 'bún', 'bánh', 'cơm', 'chè', 'canh', 'xyz']
+REGIONS = ['all', 'north', 'central', 'south', 'nationwide']
+NUM_USERS = 4
+
+
+# ----------------------------------------------------------------------------
+# Server side (runs in the subprocess)
+# ----------------------------------------------------------------------------
+
+class StubModel:
+    """Stands in for InceptionV3: fixed latency, random softmax output"""
+
+    def __init__(self, latency_ms, num_classes):
+        self.latency = latency_ms / 1000
+        self.num_classes = num_classes
+
+    def predict(self, x, batch_size=None, verbose=0):
+        time.sleep(self.latency * len(x))
+        logits = np.random.rand(len(x), self.num_classes).astype(np.float32)
+        return logits / logits.sum(axis=1, keepdims=True)
+
+
+def serve(args):
+    """Start the API with an isolated data directory"""
+    sys.path.insert(0, BACKEND_DIR)
+    data_dir = args.data_dir
+
+    import history_utils
+    import user_utils
+    import blob_utils
+    history_utils.HISTORY_DIR = os.path.join(data_dir, 'history')
+    os.makedirs(history_utils.HISTORY_DIR, exist_ok=True)
+    user_utils.USERS_PATH = os.path.join(data_dir, 'users.json')
+    blob_utils.BLOB_DIR = os.path.join(data_dir, 'blobs')
+    blob_utils.INDEX_PATH = os.path.join(blob_utils.BLOB_DIR, 'index.json')
+    blob_utils.LOG_PATH = os.path.join(blob_utils.BLOB_DIR, 'index.log')
+
+    if args.model == 'stub':
+        import model_utils
+        num_classes = len(model_utils.get_food_classes())
+        model_utils.build_model = lambda model_path: StubModel(args.stub_latency_ms, num_classes)
+
+    import api
+    if args.no_rate_limit:
+        api.limiter.enabled = False
+
+    if args.server == 'asgi':
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host='127.0.0.1', port=args.port, log_level='warning')
+    else:
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        api.app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+# ----------------------------------------------------------------------------
+# Client side
+# ----------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix='vnfoods-load-')
+    cmd = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+           '--data-dir', data_dir, '--server', args.server, '--model', args.model,
+           '--stub-latency-ms', str(args.stub_latency_ms)]
+    if args.no_rate_limit:
+        cmd.append('--no-rate-limit')
+
+    log_path = os.path.join(data_dir, 'server.log')
+    print(f"Server log: {log_path}")
+    log_file = open(log_path, 'w')
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('API server exited during startup')
+        try:
+            urllib.request.urlopen(f'{base_url}/api/health', timeout=1)
+            return proc, base_url
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.5)
+    proc.kill()
+    raise RuntimeError('API server did not become healthy in time')
+
+
+def _child_pids(pid):
+    """Direct children of a process (Linux /proc)"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # Field 4 is the parent pid; comm (field 2) may contain spaces
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _process_memory_kb(pid):
+    """PSS of one process in kB (RSS if smaps_rollup is unavailable), None if gone"""
+    for path, key in ((f'/proc/{pid}/smaps_rollup', 'Pss:'), (f'/proc/{pid}/status', 'VmRSS:')):
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+    return None
+
+
+def read_rss_mb(pid):
+    """
+    Memory of a process and all its descendants (e.g. forked decode
+    workers) in MB (Linux /proc), None if unavailable
+
+    Sums PSS rather than RSS, so pages the workers share copy-on-write with
+    the server are counted once instead of once per process.
+    """
+    total, pending = None, [pid]
+    while pending:
+        current = pending.pop()
+        kb = _process_memory_kb(current)
+        if kb is None:
+            continue
+        total = (total or 0) + kb
+        pending.extend(_child_pids(current))
+    return total / 1024 if total is not None else None
+
+
+def make_photos(images_dir=None):
+    """JPEG payloads: real photos if given, else synthetic phone-sized images"""
+    if images_dir:
+        extensions = ('.jpg', '.jpeg', '.png')
+        files = [os.path.join(images_dir, f) for f in os.listdir(images_dir) if f.lower().endswith(extensions)]
+        if files:
+            return [open(path, 'rb').read() for path in files[:20]]
+
+    rng = np.random.default_rng(0)
+    photos = []
+    for width, height in PHOTO_SIZES:
+        # Smooth gradient + noise compresses roughly like a real photo
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 25, (height, width, 3))
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        buffered = io.BytesIO()
+        Image.fromarray(pixels).save(buffered, format='JPEG', quality=90)
+        photos.append(buffered.getvalue())
+    return photos
+
+
+def http(method, url, body=None, headers=None, timeout=60):
+    """Send a request, returning (status, parsed JSON or None)"""
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b'null')
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b'null')
+        except ValueError:
+            return e.code, None
+
+
+def multipart(field, filename, data, fields=None):
+    boundary = f'----vnfoods{random.getrandbits(64):x}'
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+class TrafficMix:
+    """Weighted scenario picker with shared user sessions"""
+
+    def __init__(self, base_url, mix, photos):
+        self.base_url = base_url
+        self.photos = photos
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.users = []
+        self.history_ids = []
+        self.seen_ids = set()  # queued or already deleted, so each id is deleted once
+        self.lock = threading.Lock()
+
+    def setup_users(self):
+        for i in range(NUM_USERS):
+            username, password = f'loaduser{i}', 'loadtest-password'
+            http('POST', f'{self.base_url}/api/register',
+                 json.dumps({'username': username, 'password': password}).encode(),
+                 {'Content-Type': 'application/json'})
+            status, data = http('POST', f'{self.base_url}/api/login',
+                                json.dumps({'username': username, 'password': password}).encode(),
+                                {'Content-Type': 'application/json'})
+            if status == 200:
+                self.users.append({'username': username, 'password': password,
+                                   'access': data['access_token'], 'refresh': data['refresh_token']})
+        if not self.users:
+            raise RuntimeError('Could not log in any load-test user')
+
+    def auth(self, user):
+        return {'Authorization': f"Bearer {user['access']}"}
+
+    def run_one(self):
+        """Run one random scenario, returning (name, status, latency_s)"""
+        name = random.choices(self.names, self.weights)[0]
+        user = random.choice(self.users)
+        start = time.perf_counter()
+        status = getattr(self, f'do_{name}')(user)
+        return name, status, time.perf_counter() - start
+
+    def do_predict_anon(self, user):
+        body, headers = multipart('image', 'photo.jpg', random.choice(self.photos), {'lang': 'VN'})
+        return http('POST', f'{self.base_url}/api/predict', body, headers)[0]
+
+    def do_predict_auth(self, user):
+        body, headers = multipart('image', 'photo.jpg', random.choice(self.photos), {'lang': 'EN'})
+        return http('POST', f'{self.base_url}/api/predict', body, {**headers, **self.auth(user)})[0]
+
+    def do_search(self, user):
+        query = urllib.parse.urlencode({
+            'search': random.choice(SEARCH_TERMS), 'region': random.choice(REGIONS),
+            'page': random.randint(1, 3), 'lang': random.choice(['VN', 'EN'])
+        })
+        return http('GET', f'{self.base_url}/api/foods/search?{query}')[0]
+
+    def do_history_get(self, user):
+        status, data = http('GET', f'{self.base_url}/api/history?limit=20', headers=self.auth(user))
+        if status == 200:
+            with self.lock:
+                for item in data['history'][:2]:
+                    if item['_id'] not in self.seen_ids:
+                        self.seen_ids.add(item['_id'])
+                        self.history_ids.append((user['username'], item['_id']))
+        return status
+
+    def do_history_delete(self, user):
+        with self.lock:
+            owned = [pair for pair in self.history_ids if pair[0] == user['username']]
+            if owned:
+                self.history_ids.remove(owned[0])
+        if not owned:
+            return self.do_history_get(user)
+        return http('DELETE', f"{self.base_url}/api/history/{owned[0][1]}", headers=self.auth(user))[0]
+
+    def do_login(self, user):
+        status, data = http('POST', f'{self.base_url}/api/login',
+                            json.dumps({'username': user['username'], 'password': user['password']}).encode(),
+                            {'Content-Type': 'application/json'})
+        if status == 200:
+            user['access'], user['refresh'] = data['access_token'], data['refresh_token']
+        return status
+
+    def do_refresh(self, user):
+        status, data = http('POST', f'{self.base_url}/api/refresh',
+                            json.dumps({'refresh_token': user['refresh']}).encode(),
+                            {'Content-Type': 'application/json'})
+        if status == 200:
+            user['access'] = data['access_token']
+        return status
+
+
+def run_step(traffic, concurrency, duration, server_pid):
+    """Closed-loop load at fixed concurrency for `duration` seconds"""
+    results = []
+    results_lock = threading.Lock()
+    stop_at = time.time() + duration
+    rss_samples = []
+
+    def worker():
+        while time.time() < stop_at:
+            try:
+                result = traffic.run_one()
+            except Exception:
+                result = ('error', 0, 0.0)
+            with results_lock:
+                results.append(result)
+
+    def sample_rss():
+        while time.time() < stop_at:
+            rss = read_rss_mb(server_pid) if server_pid else None
+            if rss is not None:
+                rss_samples.append(rss)
+            time.sleep(0.5)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    threads.append(threading.Thread(target=sample_rss))
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    latencies = np.array([r[2] for r in results if r[1] and r[1] < 400]) * 1000
+    statuses = [r[1] for r in results]
+    total = max(1, len(results))
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'throughput_rps': round(len(results) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)), 1) if len(latencies) else None,
+        'error_rate': round(sum(1 for s in statuses if s == 0 or (s >= 400 and s != 429)) / total, 4),
+        'rate_limited_rate': round(statuses.count(429) / total, 4),
+        'rss_mb_peak': round(max(rss_samples), 1) if rss_samples else None,
+        'by_scenario': {
+            name: sum(1 for r in results if r[0] == name) for name in traffic.names
+        }
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if not hasattr(TrafficMix, f'do_{name.strip()}'):
+            raise argparse.ArgumentTypeError(f'Unknown scenario: {name}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API with a realistic traffic mix')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--model', choices=['stub', 'real'], default='stub')
+    parser.add_argument('--stub-latency-ms', type=float, default=95.0,
+                        help='Per-image stub inference time (default: 95, measured single-image latency)')
+    parser.add_argument('--no-rate-limit', action='store_true', help='Disable Flask-Limiter on the started server')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Scenario weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--ramp', default='1,2,4,8,16,32', help='Concurrency steps (default: 1,2,4,8,16,32)')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per concurrency step')
+    parser.add_argument('--images', help='Folder of real photos to upload')
+    parser.add_argument('--output', help='Write results JSON here for later comparison')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        print(f"Starting API ({args.server}, {args.model} model)...")
+        proc, base_url = start_server(args)
+
+    try:
+        traffic = TrafficMix(base_url, args.mix, make_photos(args.images))
+        traffic.setup_users()
+        print(f"✓ Ready ({len(traffic.users)} users, {len(traffic.photos)} photos, "
+              f"{', '.join(f'{len(p) // 1024}KB' for p in traffic.photos[:3])})\n")
+
+        print(f"{'conc':>5} {'reqs':>7} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'err %':>6} {'429 %':>6} {'RSS MB':>7}")
+        steps = []
+        for concurrency in [int(c) for c in args.ramp.split(',')]:
+            step = run_step(traffic, concurrency, args.duration, proc.pid if proc else None)
+            steps.append(step)
+            print(f"{step['concurrency']:>5} {step['requests']:>7} {step['throughput_rps']:>8} "
+                  f"{step['p50_ms'] or '-':>8} {step['p99_ms'] or '-':>8} "
+                  f"{step['error_rate'] * 100:>6.1f} {step['rate_limited_rate'] * 100:>6.1f} "
+                  f"{step['rss_mb_peak'] or '-':>7}")
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'server': 'external' if args.url else args.server,
+                    'model': None if args.url else args.model,
+                    'mix': args.mix,
+                    'duration_s': args.duration,
+                    'steps': steps
+                }, f, indent=2, ensure_ascii=False)
+            print(f"\n✓ Saved: {args.output}")
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    print("\n✓ Done")
+
+
+if __name__ == '__main__':
+    main()
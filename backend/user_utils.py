@@ -1,6 +1,6 @@
 import os
 from flask_bcrypt import Bcrypt
-from file_utils import load_json_file, save_json_file
+from file_utils import load_json_file, save_json_file, update_json_file
 
 USERS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'users.json')
 
@@ -19,13 +19,23 @@ def find_user_by_username(username):
 
 def create_user(username, password):
     bcrypt = Bcrypt()
-    users = load_users()
-    if any(u['username'] == username for u in users):
+    if find_user_by_username(username):
         return False, 'Username already exists'
     hashed = bcrypt.generate_password_hash(password).decode('utf-8')
     user = {'username': username, 'password': hashed}
-    users.append(user)
-    save_users(users)
+    created = []
+
+    # Re-check inside the update so concurrent signups can't both succeed
+    def add_user(users):
+        if not any(u['username'] == username for u in users):
+            users.append(user)
+            created.append(user)
+        return users
+
+    if not update_json_file(USERS_PATH, add_user, default=[]):
+        return False, 'Failed to save user'
+    if not created:
+        return False, 'Username already exists'
     return True, 'User created'
 
 def check_user_password(username, password):
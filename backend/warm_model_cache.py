@@ -0,0 +1,38 @@
+"""
+Build the SavedModel artifact cache at deploy time
+
+Exports the fast-loading SavedModel for registered models so the server's
+cold start only has to load it (see model_cache_utils). Run it in the build
+step, e.g. Render's buildCommand, since files written at run time don't
+survive a spin-down there.
+
+Usage:
+    python backend/warm_model_cache.py [model_name ...]   # default: DEFAULT_MODEL
+    python backend/warm_model_cache.py --all
+"""
+import os
+import sys
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+from model_utils import BASE_DIR, DEFAULT_MODEL, MODEL_REGISTRY, SHADOW_MODEL, build_model
+
+
+def main():
+    if '--all' in sys.argv[1:]:
+        names = list(MODEL_REGISTRY)
+    else:
+        names = sys.argv[1:] or [DEFAULT_MODEL] + ([SHADOW_MODEL] if SHADOW_MODEL else [])
+
+    for name in names:
+        if name not in MODEL_REGISTRY:
+            logger.error(f"Unknown model '{name}', choose from {list(MODEL_REGISTRY)}")
+            sys.exit(1)
+        build_model(os.path.join(BASE_DIR, MODEL_REGISTRY[name]), export_cache=True)
+    logger.info(f"Model cache ready ({len(names)} models)")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,25 @@ from functools import lru_cache
 
 # Model Configuration
 MODEL_PATH = "Models/InceptionV3/fine_tune_model_best.h5" 
+
+# Models selectable by name (default serves MODEL_PATH)
+DEFAULT_MODEL = "fine_tune_best"
+MODEL_REGISTRY = {
+    "fine_tune_best": MODEL_PATH,
+    "fine_tune_trained": "Models/InceptionV3/fine_tune_model_trained.h5",
+    "base_best": "Models/InceptionV3/base_model_best.h5",
+    "base_trained": "Models/InceptionV3/base_model_trained.h5",
+}
 IMAGE_SIZE = (299, 299)
 NUM_CLASSES = 40 
 BATCH_SIZE = 32 
 
+# CPU inference profile written by backend/autotune.py
+TUNING_PROFILE_PATH = "Models/InceptionV3/tuning_profile.json"
+
+# Fast-loading SavedModel exports of MODEL_PATH, keyed by the .h5 file hash
+MODEL_CACHE_DIR = "Models/InceptionV3/cache"
+
 FOOD_DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'backend', 'data', 'food_database.json')
 
 # Load FOOD_DATABASE from JSON
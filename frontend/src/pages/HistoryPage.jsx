@@ -66,7 +66,7 @@ function HistoryPage({ language = 'VN' }) {
   }, [])
 
   const handleViewImage = useCallback(async (item) => {
-    if (!item.image_base64) {
+    if (!item.image_id && !item.image_base64) {
       alert('Không có ảnh lưu trữ')
       return
     }
@@ -77,11 +77,13 @@ function HistoryPage({ language = 'VN' }) {
       })
       
       if (response.data.success) {
+        // Ảnh mới lưu trong blob store (ResultPage tải theo image_id), record cũ vẫn dùng base64
         const predictionData = {
           food_name: item.food_name,
           confidence: item.confidence,
           food_info: response.data.food,
-          imageUrl: `data:image/jpeg;base64,${item.image_base64}`,
+          image_id: item.image_id || null,
+          imageUrl: item.image_id ? null : `data:image/jpeg;base64,${item.image_base64}`,
           related: item.extra?.related || []
         }
         
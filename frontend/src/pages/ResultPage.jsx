@@ -1,8 +1,9 @@
 import { useNavigate, useLocation } from 'react-router-dom'
 import { motion } from 'framer-motion'
-import { useEffect, useMemo, memo } from 'react'
+import { useEffect, useMemo, useState, memo } from 'react'
 import { LANGUAGES } from '../config'
 import { BACKGROUND_IMAGES, TIMEOUTS, MESSAGES, ANIMATION_DELAYS } from '../utils/constants'
+import { authAxios } from '../utils/auth'
 import { 
   PageBackground, 
   ErrorState, 
@@ -33,6 +34,28 @@ const ResultPage = memo(({ language, predictionResult: propPredictionResult }) =
     }
   }, [predictionResult?.imageUrl])
 
+  // Ảnh lịch sử: tải từ blob store theo image_id, object URL gắn với lần mount này
+  const imageId = predictionResult?.image_id
+  const [historyImageUrl, setHistoryImageUrl] = useState(null)
+
+  useEffect(() => {
+    if (!imageId) return
+    let objectUrl = null
+    let cancelled = false
+    authAxios.get(`/history/image/${imageId}`, { responseType: 'blob' })
+      .then(response => {
+        if (cancelled) return
+        objectUrl = URL.createObjectURL(response.data)
+        setHistoryImageUrl(objectUrl)
+      })
+      .catch(err => console.error('Error loading history image:', err))
+    return () => {
+      cancelled = true
+      if (objectUrl) URL.revokeObjectURL(objectUrl)
+      setHistoryImageUrl(null)
+    }
+  }, [imageId])
+
   useEffect(() => {
     if (!predictionResult) {
       const timer = setTimeout(() => navigate('/search'), TIMEOUTS.redirect)
@@ -52,7 +75,8 @@ const ResultPage = memo(({ language, predictionResult: propPredictionResult }) =
     )
   }
 
-  const { food_info, confidence, imageUrl, related } = predictionResult
+  const { food_info, confidence, related } = predictionResult
+  const imageUrl = imageId ? historyImageUrl : predictionResult.imageUrl
   
   if (!food_info) {
     return (